@@ -4,8 +4,8 @@ set -o errexit
 # Atualizar sistema
 apt-get update
 
-# Instalar Tesseract OCR e idioma português
-apt-get install -y tesseract-ocr tesseract-ocr-por
+# Instalar Tesseract OCR, idioma português e poppler (PDFs)
+apt-get install -y tesseract-ocr tesseract-ocr-por poppler-utils
 
 # Instalar dependências Python
 pip install --upgrade pip
@@ -0,0 +1,125 @@
+"""
+Deduplicação de análises por conteúdo do arquivo
+Arquivo idêntico (SHA-256) já analisado com a mesma versão do modelo tem o
+resultado copiado para a nova análise, sem passar pela fila
+"""
+
+import hashlib
+import logging
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException, UploadFile
+
+logger = logging.getLogger(__name__)
+
+# Leitura do upload em blocos
+TAMANHO_BLOCO = 1024 * 1024
+
+# Contadores (compartilhados entre processos da API)
+CHAVE_METRICAS = 'boletos:metricas:dedupe'
+
+# Campos do resultado copiados da análise original
+CAMPOS_RESULTADO = [
+    'ocrDetalhes',
+    'dadosExtraidos',
+    'validacaoTecnica',
+    'predicaoML',
+    'fraudeAnalise'
+]
+
+
+async def ler_arquivo(file: UploadFile, tamanho_maximo: int) -> tuple:
+    """
+    Lê o upload em blocos, calculando o SHA-256 durante a leitura
+    Para assim que passar do tamanho máximo
+
+    Returns:
+        (bytes do arquivo, hash hexadecimal)
+    """
+    hasher = hashlib.sha256()
+    partes = []
+    tamanho = 0
+
+    while True:
+        bloco = await file.read(TAMANHO_BLOCO)
+        if not bloco:
+            break
+
+        tamanho += len(bloco)
+        if tamanho > tamanho_maximo:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Arquivo muito grande. Máximo: {tamanho_maximo // (1024 * 1024)}MB"
+            )
+
+        hasher.update(bloco)
+        partes.append(bloco)
+
+    return b''.join(partes), hasher.hexdigest()
+
+
+async def buscar_analise_identica(db, arquivo_hash: str, versao_modelo: str, janela: int):
+    """
+    Análise concluída mais recente do mesmo arquivo com a mesma versão do modelo
+
+    Args:
+        db: Banco (Motor)
+        arquivo_hash: SHA-256 do arquivo
+        versao_modelo: Versão do modelo (ml.model.versao_modelo)
+        janela: Idade máxima da análise, em segundos
+
+    Returns:
+        Documento (só _id e campos do resultado) ou None
+    """
+    return await db.analises.find_one(
+        {
+            'arquivoHash': arquivo_hash,
+            'modeloVersao': versao_modelo,
+            'status': 'completed',
+            'processedAt': {'$gte': datetime.utcnow() - timedelta(seconds=janela)}
+        },
+        projection=CAMPOS_RESULTADO,
+        sort=[('processedAt', -1)]
+    )
+
+
+def clonar_resultado(original: dict, versao_modelo: str) -> dict:
+    """Campos da nova análise concluída a partir da original"""
+    resultado = {campo: original[campo] for campo in CAMPOS_RESULTADO if campo in original}
+    resultado.update({
+        'status': 'completed',
+        'processedAt': datetime.utcnow(),
+        'processingTime': 0.0,
+        'modeloVersao': versao_modelo,
+        'deduplicadoDe': original['_id']
+    })
+    return resultado
+
+
+async def registrar_deduplicacao(redis_conn, deduplicada: bool):
+    """Conta uploads verificados e deduplicados"""
+    try:
+        pipe = redis_conn.pipeline()
+        pipe.hincrby(CHAVE_METRICAS, 'verificadas', 1)
+        if deduplicada:
+            pipe.hincrby(CHAVE_METRICAS, 'deduplicadas', 1)
+        await pipe.execute()
+    except Exception as e:
+        logger.warning(f"Deduplicação: erro ao registrar métrica: {str(e)}")
+
+
+async def estatisticas_deduplicacao(redis_conn) -> dict:
+    """Uploads verificados, deduplicados e taxa de deduplicação"""
+    valores = await redis_conn.hgetall(CHAVE_METRICAS)
+    contadores = {
+        (chave.decode() if isinstance(chave, bytes) else chave): int(valor)
+        for chave, valor in valores.items()
+    }
+
+    verificadas = contadores.get('verificadas', 0)
+    deduplicadas = contadores.get('deduplicadas', 0)
+    return {
+        'verificadas': verificadas,
+        'deduplicadas': deduplicadas,
+        'taxa_deduplicacao': deduplicadas / verificadas if verificadas else 0.0
+    }
@@ -0,0 +1,144 @@
+"""
+Status das análises por Server-Sent Events
+Cada processo da API mantém uma única assinatura no Redis (todos os canais de
+eventos) e repassa as mensagens às conexões SSE abertas nele
+"""
+
+import asyncio
+import json
+import logging
+from contextlib import asynccontextmanager
+
+from jobs.eventos import PREFIXO_CANAL, STATUS_FINAIS
+
+logger = logging.getLogger(__name__)
+
+# Eventos guardados por conexão lenta (os mais antigos são descartados)
+TAMANHO_MAXIMO_FILA = 100
+
+
+def formatar_sse(evento: dict) -> str:
+    """Evento no formato text/event-stream"""
+    return f"event: status\ndata: {json.dumps(evento, default=str)}\n\n"
+
+
+async def aguardar_status_final(fila: asyncio.Queue, timeout: float):
+    """
+    Primeiro evento completed/failed da fila de CentralEventos.assinar
+
+    Returns:
+        Evento, ou None se o tempo acabar antes
+    """
+    loop = asyncio.get_running_loop()
+    limite = loop.time() + timeout
+
+    while (restante := limite - loop.time()) > 0:
+        try:
+            evento = await asyncio.wait_for(fila.get(), timeout=restante)
+        except asyncio.TimeoutError:
+            return None
+        if evento.get('status') in STATUS_FINAIS:
+            return evento
+    return None
+
+
+class CentralEventos:
+    """Assinatura pub/sub do processo, distribuída por canal às conexões SSE"""
+
+    def __init__(self, redis_conn):
+        self.redis_conn = redis_conn
+        self._ouvintes = {}  # canal -> conjunto de filas (uma por conexão)
+        self._pubsub = None
+        self._tarefa = None
+
+    async def iniciar(self):
+        """Assina os canais de eventos e começa a distribuir"""
+        self._pubsub = self.redis_conn.pubsub(ignore_subscribe_messages=True)
+        await self._pubsub.psubscribe(f"{PREFIXO_CANAL}*")
+        self._tarefa = asyncio.create_task(self._distribuir())
+
+    async def fechar(self):
+        """Cancela a assinatura"""
+        if self._tarefa:
+            self._tarefa.cancel()
+            await asyncio.gather(self._tarefa, return_exceptions=True)
+        if self._pubsub:
+            await self._pubsub.aclose()
+
+    @asynccontextmanager
+    async def assinar(self, canal: str):
+        """Fila com os eventos do canal enquanto a conexão estiver aberta"""
+        fila = asyncio.Queue(maxsize=TAMANHO_MAXIMO_FILA)
+        self._ouvintes.setdefault(canal, set()).add(fila)
+        try:
+            yield fila
+        finally:
+            ouvintes = self._ouvintes.get(canal)
+            if ouvintes is not None:
+                ouvintes.discard(fila)
+                if not ouvintes:
+                    del self._ouvintes[canal]
+
+    async def transmitir(self, canal: str, estado_atual, ate_status_final: bool, duracao: float, intervalo_ping: float):
+        """
+        Corpo da resposta SSE: estado atual, depois os eventos do canal
+
+        Args:
+            canal: Canal assinado
+            estado_atual: Corrotina (sem argumentos) que retorna os eventos
+                iniciais; lida já com o canal assinado, para não perder transições
+            ate_status_final: Encerra após completed/failed (conexão de uma análise)
+            duracao: Segundos até encerrar (o cliente reconecta)
+            intervalo_ping: Comentário enviado sem eventos, para proxies não fecharem a conexão
+        """
+        async with self.assinar(canal) as fila:
+            for evento in await estado_atual():
+                yield formatar_sse(evento)
+                if ate_status_final and evento.get('status') in STATUS_FINAIS:
+                    return
+
+            loop = asyncio.get_running_loop()
+            limite = loop.time() + duracao
+
+            while (restante := limite - loop.time()) > 0:
+                try:
+                    evento = await asyncio.wait_for(fila.get(), timeout=min(intervalo_ping, restante))
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+
+                yield formatar_sse(evento)
+                if ate_status_final and evento.get('status') in STATUS_FINAIS:
+                    return
+
+    async def _distribuir(self):
+        while True:
+            try:
+                mensagem = await self._pubsub.get_message(timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Conexão caiu: o cliente reconecta e assina de novo na próxima leitura
+                logger.warning(f"Eventos: erro na assinatura do Redis: {str(e)}")
+                await asyncio.sleep(1)
+                continue
+
+            if mensagem is None:
+                continue
+
+            canal = mensagem['channel']
+            if isinstance(canal, bytes):
+                canal = canal.decode()
+            ouvintes = self._ouvintes.get(canal)
+            if not ouvintes:
+                continue
+
+            try:
+                evento = json.loads(mensagem['data'])
+            except (TypeError, ValueError):
+                continue
+
+            for fila in list(ouvintes):
+                if fila.full():
+                    fila.get_nowait()
+                fila.put_nowait(evento)
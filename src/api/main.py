@@ -3,29 +3,43 @@ API FastAPI - Detector de Boletos Falsos
 COM SISTEMA DE AUTENTICAÇÃO E ACESSO RÁPIDO
 """
 
-from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Request, status
+from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Request, Query, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import AsyncExitStack
 from datetime import datetime
+import asyncio
+import time
 import uuid
-import base64
 import logging
 import sys
 import os
-import json
 
 # Adicionar pasta src ao path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # Imports locais
 from database.mongodb import connect_mongodb, close_mongodb, get_db
-from redis import Redis
+from database.redis_pool import connect_redis, close_redis, get_redis
+from jobs.envelope import empacotar_job
+from jobs.blobs import criar_blob_store
+from jobs.fila import FilaJobs, definir_prioridade
+from jobs.retry import AgendadorRetry
+from jobs.metricas import Registro, MetricasFila, CONTENT_TYPE
+from jobs.eventos import canal_analise, canal_usuario, montar_evento, publicar_status, STATUS_FINAIS
+from api.deduplicacao import (
+    ler_arquivo, buscar_analise_identica, clonar_resultado,
+    registrar_deduplicacao, estatisticas_deduplicacao
+)
+from api.eventos import CentralEventos, aguardar_status_final
 
 # Configurações
 from config import settings
 
 # Autenticação
 from auth.routes import router as auth_router
-from auth.middleware import verificar_token_opcional
+from auth.middleware import verificar_token_opcional, verificar_token_obrigatorio, extrair_user_id
 
 # Logging
 logging.basicConfig(level=logging.INFO)
@@ -50,6 +64,35 @@ app.add_middleware(
 # Incluir rotas de autenticação
 app.include_router(auth_router)
 
+# Métricas Prometheus (GET /metrics)
+registro_metricas = Registro()
+metricas_fila = MetricasFila(registro_metricas)
+metrica_http = registro_metricas.histograma(
+    'boletos_http_duracao_segundos', 'Duração das requisições à API', ['rota', 'metodo', 'status']
+)
+metrica_deduplicacao = registro_metricas.contador(
+    'boletos_deduplicacao_total', 'Uploads verificados e deduplicados (todos os processos da API)', ['resultado']
+)
+
+
+@app.middleware("http")
+async def medir_requisicao(request: Request, call_next):
+    """Duração por rota (o molde da rota, não o caminho: IDs não viram rótulos)"""
+    inicio = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        rota = request.scope.get('route')
+        metrica_http.observar(
+            time.perf_counter() - inicio,
+            rota=rota.path if rota else 'desconhecida',
+            metodo=request.method,
+            status=status_code
+        )
+
 
 # =============================================
 # ENDPOINTS
@@ -81,10 +124,32 @@ async def health_check():
     }
 
 
+@app.get("/api/metricas/deduplicacao")
+async def metricas_deduplicacao():
+    """Uploads verificados, deduplicados e taxa de deduplicação"""
+    return await estatisticas_deduplicacao(get_redis())
+
+
+@app.get("/metrics")
+async def metricas():
+    """Métricas no formato do Prometheus"""
+    redis_conn = get_redis()
+    await metricas_fila.atualizar(app.state.fila, AgendadorRetry(redis_conn))
+    try:
+        stats = await estatisticas_deduplicacao(redis_conn)
+        metrica_deduplicacao.definir(stats['verificadas'], resultado='verificadas')
+        metrica_deduplicacao.definir(stats['deduplicadas'], resultado='deduplicadas')
+    except Exception as e:
+        logger.warning(f"Métricas: erro ao ler deduplicação: {str(e)}")
+
+    return Response(content=registro_metricas.exportar(), headers={"Content-Type": CONTENT_TYPE})
+
+
 @app.post("/api/analisar")
 async def analisar_boleto(
     file: UploadFile = File(...),
     request: Request = None,
+    wait: float = Query(0, ge=0, description="Segundos para aguardar o resultado (0 = só enfileirar)"),
     token_payload: dict = Depends(verificar_token_opcional)
 ):
     """
@@ -92,9 +157,12 @@ async def analisar_boleto(
     Suporta usuários autenticados e anônimos (limite: 2/dia)
     
     Aceita: image/jpeg, image/png, application/pdf
-    Retorna: ID da análise para consulta posterior
+    Retorna: ID da análise para consulta posterior, ou o resultado completo
+    se ficar pronto em até `wait` segundos
     """
     
+    # Assinatura dos eventos da análise (com wait), encerrada ao responder
+    pilha = AsyncExitStack()
     try:
         # Verificar se é usuário autenticado
         is_authenticated = token_payload is not None
@@ -143,32 +211,40 @@ async def analisar_boleto(
                 detail=f"Tipo de arquivo inválido. Aceitos: {', '.join(allowed_types)}"
             )
         
-        # 2. Validar tamanho (max 10MB)
-        file_bytes = await file.read()
+        # 2. Ler arquivo (max 10MB), calculando o hash para a deduplicação
+        file_bytes, arquivo_hash = await ler_arquivo(file, 10 * 1024 * 1024)
         file_size = len(file_bytes)
         
-        if file_size > 10 * 1024 * 1024:  # 10MB
-            raise HTTPException(
-                status_code=400,
-                detail="Arquivo muito grande. Máximo: 10MB"
-            )
-        
         if file_size == 0:
             raise HTTPException(
                 status_code=400,
                 detail="Arquivo vazio"
             )
         
-        # 3. Converter para base64
-        file_base64 = base64.b64encode(file_bytes).decode('utf-8')
-        
-        # 4. Gerar ID único
+        # 3. Gerar ID único
         analise_id = str(uuid.uuid4())
         
         logger.info(f"📄 Recebido arquivo: {file.filename} ({file_size} bytes) - ID: {analise_id}")
         
-        # 5. Salvar no MongoDB
         db = get_db()
+        
+        # Com wait: assinar os eventos antes de enfileirar, para não perder a conclusão
+        espera = min(wait, settings.analise_espera_maxima)
+        eventos = None
+        central = getattr(app.state, 'eventos', None)
+        if espera > 0 and central is not None:
+            eventos = await pilha.enter_async_context(central.assinar(canal_analise(analise_id)))
+        
+        redis_conn = get_redis()
+        
+        # 4. Mesmo arquivo já analisado com a mesma versão do modelo: reaproveitar
+        versao = getattr(app.state, 'versao_modelo', None)
+        original = None
+        if settings.dedupe_analises and versao:
+            original = await buscar_analise_identica(db, arquivo_hash, versao, settings.dedupe_janela)
+            await registrar_deduplicacao(redis_conn, original is not None)
+        
+        # 5. Salvar no MongoDB
         analise_doc = {
             '_id': analise_id,
             'status': 'processing',
@@ -176,6 +252,7 @@ async def analisar_boleto(
             'fileType': file.content_type,
             'fileSize': file_size,
             'fileName': file.filename,
+            'arquivoHash': arquivo_hash,
             'is_authenticated': is_authenticated
         }
         
@@ -185,24 +262,42 @@ async def analisar_boleto(
         else:
             analise_doc['ip_address'] = request.client.host
         
+        if original:
+            analise_doc.update(clonar_resultado(original, versao))
+        
         await db.analises.insert_one(analise_doc)
+        await publicar_status(redis_conn, analise_id, analise_doc['status'], user_id)
         
         logger.info(f"✅ Análise salva no MongoDB: {analise_id}")
         
-        # 6. Adicionar na fila Redis
-        redis_conn = Redis.from_url(settings.redis_url)
-        
-        job_data = {
-            'analise_id': analise_id,
-            'file_base64': file_base64,
-            'file_type': file.content_type,
-            'user_id': user_id,
-            'is_authenticated': is_authenticated
-        }
-        
-        redis_conn.rpush('boletos:jobs', json.dumps(job_data))
-        
-        logger.info(f"✅ Job adicionado à fila: {analise_id}")
+        if original:
+            logger.info(f"♻️ Resultado reaproveitado da análise {original['_id']}: {analise_id}")
+        else:
+            # 6. Gravar arquivo no blob store e adicionar só a referência na fila Redis,
+            # na faixa de prioridade do usuário (premium, autenticado, anônimo)
+            plano = None
+            if is_authenticated:
+                from bson import ObjectId
+                usuario = await db.usuarios.find_one({"_id": ObjectId(user_id)}, {"plano": 1})
+                plano = usuario.get("plano") if usuario else None
+            prioridade = definir_prioridade(is_authenticated, plano, settings.fila_planos_premium)
+            
+            blob_ref = await app.state.blob_store.salvar(file_bytes)
+            
+            job_data = {
+                'analise_id': analise_id,
+                'blob_ref': blob_ref,
+                'file_type': file.content_type,
+                'user_id': user_id,
+                'is_authenticated': is_authenticated,
+                'prioridade': prioridade
+            }
+            if not is_authenticated:
+                job_data['ip_address'] = request.client.host
+            
+            await app.state.fila.enfileirar(empacotar_job(job_data, b''), job_data)
+            
+            logger.info(f"✅ Job adicionado à fila ({prioridade}): {analise_id}")
         
         # 7. Incrementar contador do usuário se autenticado
         if is_authenticated:
@@ -212,16 +307,28 @@ async def analisar_boleto(
                 {"$inc": {"analises_realizadas": 1}}
             )
         
-        # 8. Retornar resposta
-        response = {
-            "id": analise_id,
-            "status": "processing",
-            "message": "Boleto recebido e adicionado à fila de processamento",
-            "fileName": file.filename,
-            "fileSize": file_size,
-            "fileType": file.content_type,
-            "is_authenticated": is_authenticated
-        }
+        # 8. Com wait: aguardar o worker (sem bloquear o event loop) e devolver o resultado
+        finalizada = analise_doc['status'] in STATUS_FINAIS
+        if eventos is not None and not finalizada:
+            finalizada = await aguardar_status_final(eventos, espera) is not None
+        
+        if espera > 0 and finalizada:
+            analise = await db.analises.find_one({'_id': analise_id})
+            response = _formatar_analise(analise, is_authenticated)
+        else:
+            response = {
+                "id": analise_id,
+                "status": analise_doc['status'],
+                "message": (
+                    "Boleto já analisado: resultado disponível"
+                    if original else
+                    "Boleto recebido e adicionado à fila de processamento"
+                ),
+                "fileName": file.filename,
+                "fileSize": file_size,
+                "fileType": file.content_type,
+                "is_authenticated": is_authenticated
+            }
         
         if not is_authenticated:
             # Calcular análises restantes
@@ -240,6 +347,8 @@ async def analisar_boleto(
             status_code=500,
             detail=f"Erro interno ao processar arquivo: {str(e)}"
         )
+    finally:
+        await pilha.aclose()
 
 
 @app.get("/api/analise/{analise_id}")
@@ -273,21 +382,7 @@ async def consultar_analise(
                 detail="Acesso negado a esta análise"
             )
         
-        # Remover _id do MongoDB
-        analise['id'] = analise.pop('_id')
-        
-        # Se não autenticado, remover detalhes sensíveis
-        if not is_authenticated:
-            # Remover explicação detalhada
-            if 'fraudeAnalise' in analise and 'explicacao' in analise['fraudeAnalise']:
-                analise['fraudeAnalise']['explicacao'] = {
-                    "mensagem": "Faça login para ver explicação detalhada!"
-                }
-            
-            analise['acesso_limitado'] = True
-            analise['mensagem'] = "Resultados básicos. Faça login para ver detalhes completos!"
-        
-        return analise
+        return _formatar_analise(analise, is_authenticated)
         
     except HTTPException:
         raise
@@ -299,6 +394,116 @@ async def consultar_analise(
         )
 
 
+def _formatar_analise(analise: dict, is_authenticated: bool) -> dict:
+    """Documento da análise para a resposta (sem detalhes para anônimos)"""
+    
+    # Remover _id do MongoDB
+    analise['id'] = analise.pop('_id')
+    
+    # Se não autenticado, remover detalhes sensíveis
+    if not is_authenticated:
+        # Remover explicação detalhada
+        if 'fraudeAnalise' in analise and 'explicacao' in analise['fraudeAnalise']:
+            analise['fraudeAnalise']['explicacao'] = {
+                "mensagem": "Faça login para ver explicação detalhada!"
+            }
+        
+        analise['acesso_limitado'] = True
+        analise['mensagem'] = "Resultados básicos. Faça login para ver detalhes completos!"
+    
+    return analise
+
+
+@app.get("/api/analise/{analise_id}/eventos")
+async def eventos_analise(
+    analise_id: str,
+    token_payload: dict = Depends(verificar_token_opcional)
+):
+    """
+    Status da análise por Server-Sent Events (em vez de consultar em loop)
+    Envia o status atual e cada mudança; encerra em completed/failed
+    """
+    
+    central = _central_eventos()
+    
+    # Mesmas regras de acesso da consulta
+    db = get_db()
+    analise = await db.analises.find_one({'_id': analise_id}, {'user_id': 1})
+    
+    if not analise:
+        raise HTTPException(
+            status_code=404,
+            detail="Análise não encontrada"
+        )
+    
+    if token_payload is not None and analise.get('user_id') != token_payload.get("sub"):
+        raise HTTPException(
+            status_code=403,
+            detail="Acesso negado a esta análise"
+        )
+    
+    async def estado_atual():
+        atual = await db.analises.find_one({'_id': analise_id}, {'status': 1})
+        return [montar_evento(analise_id, atual['status'])] if atual else []
+    
+    return _resposta_sse(central.transmitir(
+        canal_analise(analise_id),
+        estado_atual,
+        ate_status_final=True,
+        duracao=settings.sse_duracao_maxima,
+        intervalo_ping=settings.sse_intervalo_ping
+    ))
+
+
+@app.get("/api/eventos")
+async def eventos_usuario(token_payload: dict = Depends(verificar_token_obrigatorio)):
+    """
+    Mudanças de status de todas as análises do usuário (Server-Sent Events)
+    Ao conectar, envia as análises ainda em processamento
+    """
+    
+    central = _central_eventos()
+    user_id = extrair_user_id(token_payload)
+    db = get_db()
+    
+    async def estado_atual():
+        cursor = db.analises.find(
+            {'user_id': user_id, 'status': 'processing'},
+            {'status': 1}
+        ).sort('uploadedAt', -1).limit(50)
+        return [montar_evento(analise['_id'], analise['status']) async for analise in cursor]
+    
+    return _resposta_sse(central.transmitir(
+        canal_usuario(user_id),
+        estado_atual,
+        ate_status_final=False,
+        duracao=settings.sse_duracao_maxima,
+        intervalo_ping=settings.sse_intervalo_ping
+    ))
+
+
+def _central_eventos() -> CentralEventos:
+    """Assinatura de eventos do processo (503 se o Redis não estava disponível)"""
+    central = getattr(app.state, 'eventos', None)
+    if central is None:
+        raise HTTPException(
+            status_code=503,
+            detail="Eventos de status indisponíveis no momento"
+        )
+    return central
+
+
+def _resposta_sse(corpo) -> StreamingResponse:
+    return StreamingResponse(
+        corpo,
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # nginx: não acumular o stream
+        }
+    )
+
+
 @app.get("/api/historico")
 async def obter_historico(
     token_payload: dict = Depends(verificar_token_opcional),
@@ -357,16 +562,27 @@ async def test_ocr(
     """
     Endpoint de teste completo: OCR + Parser + Validação + ML + Explicabilidade
     Suporta usuários autenticados e anônimos
+    Roda no executor limitado da API: com todas as vagas ocupadas, responde 503
     """
     
+    # Vaga no executor (sem esperar: ocupado, o cliente tenta de novo depois)
+    vagas = app.state.test_ocr_vagas
+    if vagas.locked():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Servidor ocupado com outras análises. Tente novamente em instantes.",
+            headers={"Retry-After": str(settings.test_ocr_retry_after)}
+        )
+    await vagas.acquire()
+    
     try:
         # Verificar autenticação
         is_authenticated = token_payload is not None
         user_id = token_payload.get("sub") if is_authenticated else None
+        db = get_db()
         
         # Se não autenticado, verificar limite
         if not is_authenticated:
-            db = get_db()
             ip_address = request.client.host
             
             hoje = datetime.utcnow().date()
@@ -396,36 +612,20 @@ async def test_ocr(
             )
         
         # Imports
-        from ml.ocr import extrair_texto_tesseract
-        from ml.parser import parse_dados_boleto
-        from ml.validator import validar_boleto_febraban
-        from ml.model import carregar_modelo, preparar_features, predizer_fraude
-        from ml.explainer import gerar_explicacao_humanizada
+        from ml.ocr_pool import get_ocr_pool
         
         # Ler arquivo
         file_bytes = await file.read()
         
         logger.info(f"📄 Processando: {file.filename}")
         
-        # 1. OCR
-        texto = extrair_texto_tesseract(file_bytes)
-        
-        # 2. Parser
-        dados = parse_dados_boleto(texto)
-        
-        # 3. Validação FEBRABAN
-        validacao = validar_boleto_febraban(dados)
+        # 1. OCR (no pool de processos, sem bloquear o event loop)
+        texto = await get_ocr_pool().extrair_texto_async(file_bytes)
         
-        # 4. Modelo ML
-        modelo = carregar_modelo()
-        features = preparar_features(dados)
-        predicao_ml = predizer_fraude(modelo, features)
-        
-        # 5. Explicabilidade
-        explicacao = gerar_explicacao_humanizada(
-            dados_extraidos=dados,
-            resultado_validacao=validacao,
-            predicao_ml=predicao_ml
+        # 2-5. Parser, validação, modelo e explicabilidade (no executor limitado)
+        loop = asyncio.get_running_loop()
+        dados, validacao, predicao_ml, explicacao = await loop.run_in_executor(
+            app.state.test_ocr_executor, _pipeline_teste, texto
         )
         
         # 6. Resultado final
@@ -483,6 +683,36 @@ async def test_ocr(
             status_code=500,
             detail=f"Erro: {str(e)}"
         )
+    finally:
+        vagas.release()
+
+
+def _pipeline_teste(texto: str) -> tuple:
+    """Etapas síncronas de /api/test-ocr (pandas, sklearn): roda fora do event loop"""
+    from ml.parser import parse_dados_boleto
+    from ml.validator import validar_boleto_febraban
+    from ml.model import carregar_modelo, preparar_features, predizer_fraude
+    from ml.explainer import gerar_explicacao_humanizada
+    
+    # 2. Parser
+    dados = parse_dados_boleto(texto)
+    
+    # 3. Validação FEBRABAN
+    validacao = validar_boleto_febraban(dados)
+    
+    # 4. Modelo ML
+    modelo = carregar_modelo()
+    features = preparar_features(dados)
+    predicao_ml = predizer_fraude(modelo, features)
+    
+    # 5. Explicabilidade
+    explicacao = gerar_explicacao_humanizada(
+        dados_extraidos=dados,
+        resultado_validacao=validacao,
+        predicao_ml=predicao_ml
+    )
+    
+    return dados, validacao, predicao_ml, explicacao
 
 
 # =============================================
@@ -503,8 +733,38 @@ async def startup_event():
     await db.usuarios.create_index("email", unique=True)
     await db.acessos_anonimos.create_index("ip_address")
     await db.analises.create_index("user_id")
+    await db.analises.create_index([("arquivoHash", 1), ("modeloVersao", 1), ("processedAt", -1)])
     
     logger.info("✅ Índices criados!")
+    
+    # Redis: um pool de conexões para fila, blobs, cache e eventos
+    await connect_redis(settings.redis_url, settings.redis_max_conexoes, settings.redis_espera_conexao)
+    app.state.fila = FilaJobs(get_redis(), pesos=settings.fila_pesos)
+    app.state.blob_store = criar_blob_store(settings, get_redis())
+    
+    # Versão do modelo (chave da deduplicação junto com o hash do arquivo)
+    from ml.model import versao_modelo
+    try:
+        app.state.versao_modelo = versao_modelo(settings.model_path)
+        logger.info(f"🧠 Versão do modelo: {app.state.versao_modelo}")
+    except OSError as e:
+        app.state.versao_modelo = None
+        logger.warning(f"Deduplicação desativada: modelo não encontrado ({str(e)})")
+    
+    # /api/test-ocr: executor limitado (o event loop segue livre para as outras rotas)
+    app.state.test_ocr_executor = ThreadPoolExecutor(
+        max_workers=max(1, settings.test_ocr_concorrencia),
+        thread_name_prefix='test-ocr'
+    )
+    app.state.test_ocr_vagas = asyncio.Semaphore(max(1, settings.test_ocr_concorrencia))
+    
+    # Assinatura dos eventos de status (Server-Sent Events)
+    app.state.eventos = CentralEventos(get_redis())
+    try:
+        await app.state.eventos.iniciar()
+    except Exception as e:
+        app.state.eventos = None
+        logger.warning(f"Eventos de status desativados: {str(e)}")
 
 
 @app.on_event("shutdown")
@@ -512,6 +772,23 @@ async def shutdown_event():
     """Executado quando a API desliga"""
     logger.info("🔴 API desligando...")
     
+    # Encerrar assinatura de eventos
+    eventos = getattr(app.state, 'eventos', None)
+    if eventos is not None:
+        await eventos.fechar()
+    
+    # Fechar pool do Redis
+    await close_redis()
+    
+    # Encerrar executor do /api/test-ocr
+    executor = getattr(app.state, 'test_ocr_executor', None)
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+    
+    # Encerrar pool de OCR
+    from ml.ocr_pool import fechar_ocr_pool
+    fechar_ocr_pool()
+    
     # Fechar MongoDB
     await close_mongodb()
 
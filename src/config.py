@@ -4,7 +4,7 @@ Lê variáveis de ambiente
 """
 
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import Dict, List
 
 
 class Settings(BaseSettings):
@@ -16,6 +16,8 @@ class Settings(BaseSettings):
     
     # Redis
     redis_url: str
+    redis_max_conexoes: int = 50  # Pool da API: acima disso a requisição espera uma conexão livre
+    redis_espera_conexao: int = 5  # Segundos esperando conexão livre antes de erro
     
     # API
     api_host: str = "0.0.0.0"
@@ -33,6 +35,61 @@ class Settings(BaseSettings):
     # Sentry (opcional)
     sentry_dsn: str = ""
     
+    # Arquivos enviados (fora da fila, referenciados pelo job)
+    blob_backend: str = "redis"  # "redis" ou "filesystem" (diretório compartilhado)
+    blob_dir: str = "/tmp/detectabb-blobs"
+    blob_ttl: int = 24 * 3600  # Segundos
+    
+    # Worker
+    worker_concurrency: int = 16  # Jobs em andamento por worker (limitado aos processos do pool de OCR)
+    worker_cpu_threads: int = 4  # Threads para as etapas de CPU fora do OCR (parser, validação, modelo)
+    worker_prazo_encerramento: int = 25  # Segundos para drenar jobs no SIGTERM (Render mata em 30s)
+    worker_processos: int = 0  # Processos do supervisor (0 = número de CPUs)
+    worker_memoria_maxima_mb: int = 0  # Memória própria acima disso: supervisor recicla o worker (0 = sem limite)
+    worker_metricas_porta: int = 9100  # Porta das métricas Prometheus do worker (+1 por processo do supervisor; 0 = desligado)
+    fila_reclaim_ocioso: int = 300  # Job pendente há mais que isso (s) é reassumido por outro worker
+    fila_reclaim_intervalo: int = 30  # Frequência (s) da busca por jobs abandonados
+    fila_pesos: Dict[str, int] = {"premium": 6, "autenticado": 3, "anonimo": 1}  # Peso de cada faixa de prioridade
+    fila_planos_premium: List[str] = ["premium"]  # Planos atendidos pela faixa premium
+    fila_max_por_usuario: int = 2  # Jobs em andamento por usuário/IP (somando todos os workers)
+    retry_max_tentativas: int = 3  # Tentativas por job antes da DLQ
+    retry_atraso_base: float = 10  # Atraso (s) da 1ª nova tentativa; dobra a cada falha
+    retry_atraso_maximo: float = 300
+    
+    # OCR
+    ocr_workers: int = 0  # Processos do pool de OCR (0 = número de CPUs)
+    ocr_timeout: int = 60  # Tempo máximo de OCR por job (segundos); esgotado, o PDF fica com a 1ª página
+    ocr_grayscale: bool = True
+    ocr_redimensionar: bool = True
+    ocr_dpi_alvo: int = 300
+    ocr_binarizar: bool = True
+    ocr_deskew: bool = True
+    ocr_roi_linha: bool = True  # OCR só da faixa da linha digitável (e da ficha) antes da página inteira
+    ocr_texto_pdf: bool = True  # Usar camada de texto de PDFs digitais antes de rasterizar
+    ocr_codigo_barras: bool = True  # Ler o código de barras da imagem antes do OCR
+    ocr_max_paginas: int = 5  # Páginas do PDF examinadas em busca da ficha de compensação
+    ocr_paginas_paralelas: int = 2  # Páginas do PDF (depois da 1ª) processadas ao mesmo tempo
+    ocr_dpis_pdf: List[int] = [150, 300]  # Escada de DPI: sobe só se a anterior não validar
+    
+    # Cache de OCR (SHA-256 do arquivo + configuração)
+    ocr_cache: bool = True
+    ocr_cache_tamanho: int = 256  # Itens no LRU em memória
+    ocr_cache_redis: bool = True
+    ocr_cache_ttl: int = 7 * 24 * 3600  # TTL no Redis (segundos)
+    
+    # Deduplicação de análises (mesmo arquivo + mesma versão do modelo)
+    dedupe_analises: bool = True
+    dedupe_janela: int = 7 * 24 * 3600  # Idade máxima (segundos) da análise reaproveitada
+    
+    # Status das análises (Server-Sent Events e espera em /api/analisar)
+    sse_duracao_maxima: int = 300  # Segundos por conexão (o cliente reconecta)
+    sse_intervalo_ping: int = 15  # Comentário periódico para proxies não fecharem a conexão
+    analise_espera_maxima: int = 30  # Limite (s) do parâmetro wait de /api/analisar
+    
+    # /api/test-ocr (pipeline na própria API, fora do event loop)
+    test_ocr_concorrencia: int = 2  # Análises simultâneas por processo da API; acima disso, 503
+    test_ocr_retry_after: int = 5  # Segundos sugeridos no Retry-After do 503
+    
     # Paths
     model_path: str = "src/models/modelo_boleto.pkl"
     
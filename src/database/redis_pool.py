@@ -0,0 +1,42 @@
+"""
+Redis - Cliente assíncrono compartilhado (pool de conexões)
+"""
+
+import logging
+from redis.asyncio import Redis, BlockingConnectionPool
+
+logger = logging.getLogger(__name__)
+
+# Cliente global
+client = None
+
+
+async def connect_redis(redis_url: str, max_conexoes: int = 50, espera: int = 5):
+    """Cria o pool de conexões (as conexões abrem sob demanda e são reutilizadas)"""
+    global client
+    
+    pool = BlockingConnectionPool.from_url(redis_url, max_connections=max_conexoes, timeout=espera)
+    client = Redis(connection_pool=pool)
+    
+    # Testar conexão (Redis fora do ar não impede a API de subir)
+    try:
+        await client.ping()
+        logger.info(f"✅ Redis conectado (pool de até {max_conexoes} conexões)")
+    except Exception as e:
+        logger.warning(f"⚠️ Redis indisponível ao iniciar: {str(e)}")
+
+
+async def close_redis():
+    """Fecha o cliente e as conexões do pool"""
+    global client
+    
+    if client:
+        await client.aclose()
+        await client.connection_pool.disconnect()
+        client = None
+        logger.info("👋 Redis desconectado")
+
+
+def get_redis() -> Redis:
+    """Retorna o cliente compartilhado"""
+    return client
@@ -0,0 +1,207 @@
+"""
+Armazenamento dos arquivos enviados fora da fila (endereçado por conteúdo)
+O job na fila carrega só a referência; o arquivo é gravado uma vez e
+removido quando nenhum job o referencia mais
+"""
+
+import abc
+import asyncio
+import hashlib
+import logging
+import os
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+PREFIXO_REFERENCIA = 'sha256:'
+PREFIXO_CHAVE = 'boletos:blob:'
+
+
+class BlobNaoEncontrado(Exception):
+    """Arquivo referenciado pelo job não existe mais (expirou ou foi removido)"""
+
+
+class BlobStore(abc.ABC):
+    """
+    Interface do armazenamento de arquivos
+
+    A contagem de referências e o lock por arquivo ficam no Redis, de modo que
+    o mesmo arquivo enviado duas vezes ao mesmo tempo só é removido depois do
+    último job. Usa cliente redis.asyncio
+    """
+
+    def __init__(self, redis_conn, ttl: int = 24 * 3600):
+        self.redis_conn = redis_conn
+        self.ttl = ttl
+
+    async def salvar(self, dados: bytes) -> str:
+        """Grava o arquivo (se ainda não existir) e retorna a referência"""
+        digest = hashlib.sha256(dados).hexdigest()
+
+        async with self._lock(digest):
+            await self.redis_conn.incr(self._chave_refs(digest))
+            await self.redis_conn.expire(self._chave_refs(digest), self.ttl)
+            if not await self._existe(digest):
+                await self._gravar(digest, dados)
+            else:
+                await self._renovar(digest)
+
+        return f"{PREFIXO_REFERENCIA}{digest}"
+
+    async def obter(self, referencia: str) -> bytes:
+        """Lê o arquivo referenciado"""
+        dados = await self._ler(self._digest(referencia))
+        if dados is None:
+            raise BlobNaoEncontrado(f"Arquivo não encontrado: {referencia}")
+        return dados
+
+    async def liberar(self, referencia: str):
+        """Solta uma referência; remove o arquivo quando não sobrar nenhuma"""
+        digest = self._digest(referencia)
+
+        async with self._lock(digest):
+            restantes = await self.redis_conn.decr(self._chave_refs(digest))
+            if restantes <= 0:
+                await self.redis_conn.delete(self._chave_refs(digest))
+                await self._apagar(digest)
+
+    def _lock(self, digest: str):
+        return self.redis_conn.lock(f"{PREFIXO_CHAVE}{digest}:lock", timeout=30, blocking_timeout=30)
+
+    @staticmethod
+    def _chave_refs(digest: str) -> str:
+        return f"{PREFIXO_CHAVE}{digest}:refs"
+
+    @staticmethod
+    def _digest(referencia: str) -> str:
+        if not referencia.startswith(PREFIXO_REFERENCIA):
+            raise ValueError(f"Referência inválida: {referencia}")
+        return referencia[len(PREFIXO_REFERENCIA):]
+
+    # Operações do backend
+
+    @abc.abstractmethod
+    async def _existe(self, digest: str) -> bool:
+        """Se o arquivo está gravado"""
+
+    @abc.abstractmethod
+    async def _gravar(self, digest: str, dados: bytes):
+        """Grava o arquivo com validade de ttl segundos"""
+
+    async def _renovar(self, digest: str):
+        """Estende a validade de um arquivo já existente (opcional)"""
+
+    @abc.abstractmethod
+    async def _ler(self, digest: str):
+        """Conteúdo do arquivo, ou None se não existir"""
+
+    @abc.abstractmethod
+    async def _apagar(self, digest: str):
+        """Remove o arquivo (sem erro se já não existir)"""
+
+
+class RedisBlobStore(BlobStore):
+    """Arquivos em chaves do Redis com TTL"""
+
+    def _chave(self, digest: str) -> str:
+        return f"{PREFIXO_CHAVE}{digest}"
+
+    async def _existe(self, digest: str) -> bool:
+        return bool(await self.redis_conn.exists(self._chave(digest)))
+
+    async def _gravar(self, digest: str, dados: bytes):
+        await self.redis_conn.set(self._chave(digest), dados, ex=self.ttl)
+
+    async def _renovar(self, digest: str):
+        await self.redis_conn.expire(self._chave(digest), self.ttl)
+
+    async def _ler(self, digest: str):
+        return await self.redis_conn.get(self._chave(digest))
+
+    async def _apagar(self, digest: str):
+        await self.redis_conn.delete(self._chave(digest))
+
+
+class FilesystemBlobStore(BlobStore):
+    """
+    Arquivos num diretório local (compartilhado entre API e worker)
+    O acesso ao disco roda em thread para não bloquear o event loop
+    """
+
+    def __init__(self, redis_conn, diretorio: str, ttl: int = 24 * 3600):
+        super().__init__(redis_conn, ttl)
+        self.diretorio = diretorio
+        os.makedirs(diretorio, exist_ok=True)
+
+    def _caminho(self, digest: str) -> str:
+        return os.path.join(self.diretorio, digest[:2], digest)
+
+    async def _existe(self, digest: str) -> bool:
+        return await asyncio.to_thread(os.path.exists, self._caminho(digest))
+
+    async def _gravar(self, digest: str, dados: bytes):
+        await asyncio.to_thread(self._gravar_arquivo, digest, dados)
+
+    def _gravar_arquivo(self, digest: str, dados: bytes):
+        caminho = self._caminho(digest)
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+
+        # Escrita atômica: o worker nunca lê arquivo pela metade
+        temporario = f"{caminho}.{uuid.uuid4().hex}.tmp"
+        with open(temporario, 'wb') as f:
+            f.write(dados)
+        os.replace(temporario, caminho)
+
+    async def _renovar(self, digest: str):
+        await asyncio.to_thread(os.utime, self._caminho(digest))
+
+    async def _ler(self, digest: str):
+        return await asyncio.to_thread(self._ler_arquivo, digest)
+
+    def _ler_arquivo(self, digest: str):
+        try:
+            with open(self._caminho(digest), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    async def _apagar(self, digest: str):
+        try:
+            await asyncio.to_thread(os.remove, self._caminho(digest))
+        except FileNotFoundError:
+            pass
+
+    def limpar_orfaos(self) -> int:
+        """
+        Remove arquivos mais antigos que o TTL (jobs perdidos nunca liberam a referência)
+
+        Returns:
+            Quantidade de arquivos removidos
+        """
+        limite = time.time() - self.ttl
+        removidos = 0
+
+        for raiz, _, arquivos in os.walk(self.diretorio):
+            for nome in arquivos:
+                caminho = os.path.join(raiz, nome)
+                try:
+                    if os.path.getmtime(caminho) < limite:
+                        os.remove(caminho)
+                        removidos += 1
+                except FileNotFoundError:
+                    continue
+
+        if removidos:
+            logger.info(f"🧹 {removidos} arquivo(s) órfão(s) removido(s) de {self.diretorio}")
+
+        return removidos
+
+
+def criar_blob_store(settings, redis_conn) -> BlobStore:
+    """Cria o armazenamento configurado (settings.blob_backend)"""
+    if settings.blob_backend == 'filesystem':
+        return FilesystemBlobStore(redis_conn, settings.blob_dir, settings.blob_ttl)
+    if settings.blob_backend == 'redis':
+        return RedisBlobStore(redis_conn, settings.blob_ttl)
+    raise ValueError(f"blob_backend desconhecido: {settings.blob_backend}")
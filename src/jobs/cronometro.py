@@ -0,0 +1,34 @@
+"""
+Tempo de cada etapa do processamento (relógio monotônico)
+"""
+
+import time
+from contextlib import contextmanager
+
+
+class Cronometro:
+    """Acumula a duração (ms) de cada etapa de um job"""
+
+    def __init__(self):
+        self.etapas = {}
+        self.falha = None  # Etapa em que o job falhou
+
+    @contextmanager
+    def etapa(self, nome: str):
+        """Mede o bloco (conta mesmo se a etapa falhar)"""
+        inicio = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.falha = self.falha or nome
+            raise
+        finally:
+            self.registrar(nome, (time.perf_counter() - inicio) * 1000)
+
+    def registrar(self, nome: str, duracao_ms: float):
+        """Soma uma duração já medida à etapa"""
+        self.etapas[nome] = self.etapas.get(nome, 0.0) + duracao_ms
+
+    def documento(self) -> dict:
+        """Durações arredondadas (ms), para gravar na análise"""
+        return {nome: round(duracao, 1) for nome, duracao in self.etapas.items()}
@@ -0,0 +1,51 @@
+"""
+Envelope binário dos jobs da fila
+Cabeçalho pequeno com metadados (JSON) + bytes crus do arquivo, sem base64
+"""
+
+import base64
+import json
+import struct
+
+# Assinatura + versão do formato
+MAGIC = b'BBJ1'
+
+# Tamanho do cabeçalho JSON: uint32 big-endian
+_TAMANHO = struct.Struct('>I')
+
+
+def empacotar_job(metadados: dict, arquivo_bytes: bytes) -> bytes:
+    """
+    Monta o envelope: MAGIC + tamanho do cabeçalho + cabeçalho JSON + arquivo
+    """
+
+    cabecalho = json.dumps(metadados, separators=(',', ':')).encode('utf-8')
+    return b''.join((MAGIC, _TAMANHO.pack(len(cabecalho)), cabecalho, arquivo_bytes))
+
+
+def desempacotar_job(dados: bytes) -> tuple:
+    """
+    Lê o envelope
+
+    Returns:
+        (metadados, arquivo_bytes)
+    """
+
+    if not dados.startswith(MAGIC):
+        return _desempacotar_legado(dados)
+
+    inicio = len(MAGIC) + _TAMANHO.size
+    (tamanho,) = _TAMANHO.unpack_from(dados, len(MAGIC))
+    metadados = json.loads(dados[inicio:inicio + tamanho])
+
+    return metadados, dados[inicio + tamanho:]
+
+
+def _desempacotar_legado(dados: bytes) -> tuple:
+    """
+    Jobs antigos (JSON com file_base64), ainda na fila durante o deploy
+    """
+
+    job_data = json.loads(dados)
+    arquivo_bytes = base64.b64decode(job_data.pop('file_base64'))
+    return job_data, arquivo_bytes
@@ -0,0 +1,52 @@
+"""
+Eventos de mudança de status das análises (Redis pub/sub)
+O worker publica cada transição (e a API, as análises criadas ou resolvidas
+na hora); a API repassa aos clientes por Server-Sent Events
+"""
+
+import json
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+PREFIXO_CANAL = 'boletos:eventos:'
+
+# Status depois dos quais a análise não muda mais
+STATUS_FINAIS = ('completed', 'failed')
+
+
+def canal_analise(analise_id: str) -> str:
+    """Canal com os eventos de uma análise"""
+    return f"{PREFIXO_CANAL}analise:{analise_id}"
+
+
+def canal_usuario(user_id: str) -> str:
+    """Canal com os eventos de todas as análises do usuário"""
+    return f"{PREFIXO_CANAL}usuario:{user_id}"
+
+
+def montar_evento(analise_id: str, status: str, **dados) -> dict:
+    """Evento de status (dados extras: tentativa, erro, is_fraudulento...)"""
+    return {
+        'analise_id': analise_id,
+        'status': status,
+        'timestamp': datetime.utcnow().isoformat(),
+        **dados
+    }
+
+
+async def publicar_status(redis_conn, analise_id: str, status: str, user_id: str = None, **dados):
+    """
+    Publica a mudança de status no canal da análise e no do usuário
+    Falha na publicação só gera aviso: o status no MongoDB continua valendo
+    """
+    evento = json.dumps(montar_evento(analise_id, status, **dados))
+    try:
+        pipe = redis_conn.pipeline(transaction=False)
+        pipe.publish(canal_analise(analise_id), evento)
+        if user_id:
+            pipe.publish(canal_usuario(user_id), evento)
+        await pipe.execute()
+    except Exception as e:
+        logger.warning(f"Eventos: erro ao publicar status de {analise_id}: {str(e)}")
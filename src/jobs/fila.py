@@ -0,0 +1,413 @@
+"""
+Fila de jobs confiável sobre Redis Streams com consumer groups
+O job só sai da fila depois de confirmado (XACK); jobs de workers que
+morreram são reivindicados por outro worker (XAUTOCLAIM)
+
+Cada faixa de prioridade é dividida em sub-filas por usuário (um stream por
+usuário ou IP). O worker escolhe a faixa por round-robin ponderado e, dentro
+dela, alterna entre os usuários (round-robin, um job por vez), respeitando um
+limite de jobs em andamento por usuário: quem envia milhares de boletos não
+atrasa os outros usuários da mesma faixa
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import time
+from collections import deque
+
+from redis.exceptions import ResponseError
+
+from jobs.envelope import desempacotar_job
+
+logger = logging.getLogger(__name__)
+
+STREAM_JOBS = 'boletos:jobs:stream'
+GRUPO_WORKERS = 'boletos:workers'
+
+# Lista usada antes dos streams (migrada pelo worker)
+FILA_LEGADA = 'boletos:jobs'
+
+# Usuários com jobs na faixa (conjunto de streams)
+PREFIXO_ATIVOS = 'boletos:jobs:ativos:'
+
+# Avisa workers ociosos que chegou job (um item por job, limitada)
+LISTA_SINAL = 'boletos:jobs:sinal'
+TAMANHO_MAXIMO_SINAL = 1000
+
+CAMPO_JOB = b'job'
+
+# Faixas de prioridade
+PRIORIDADE_PREMIUM = 'premium'
+PRIORIDADE_AUTENTICADO = 'autenticado'
+PRIORIDADE_ANONIMO = 'anonimo'
+
+PESOS_PADRAO = {
+    PRIORIDADE_PREMIUM: 6,
+    PRIORIDADE_AUTENTICADO: 3,
+    PRIORIDADE_ANONIMO: 1
+}
+
+# Frequência (s) com que o worker busca usuários novos em cada faixa
+INTERVALO_RODIZIO = 1.0
+
+# Cria o stream/grupo do usuário se preciso, adiciona o job e marca o usuário como ativo
+# KEYS: stream do usuário, ativos da faixa, sinal | ARGV: grupo, job, tamanho máximo do sinal
+SCRIPT_ENFILEIRAR = """
+redis.pcall('XGROUP', 'CREATE', KEYS[1], ARGV[1], '0', 'MKSTREAM')
+local id = redis.call('XADD', KEYS[1], '*', 'job', ARGV[2])
+redis.call('SADD', KEYS[2], KEYS[1])
+redis.call('RPUSH', KEYS[3], '1')
+redis.call('LTRIM', KEYS[3], -tonumber(ARGV[3]), -1)
+return id
+"""
+
+# Lê um job do usuário, se ele estiver abaixo do limite de jobs em andamento
+# (pendentes no grupo, de qualquer worker); stream vazio sai da faixa
+# KEYS: stream do usuário, ativos da faixa | ARGV: grupo, consumidor, limite
+# Retorna {id, job}, 0 (vazio), 1 (no limite) ou 2 (só pendentes)
+_SCRIPT_LER_USUARIO = """
+if redis.call('XLEN', KEYS[1]) == 0 then
+    redis.call('DEL', KEYS[1])
+    redis.call('SREM', KEYS[2], KEYS[1])
+    return 0
+end
+local pendentes = redis.call('XPENDING', KEYS[1], ARGV[1])
+if tonumber(pendentes[1]) >= tonumber(ARGV[3]) then
+    return 1
+end
+local resposta = redis.call('XREADGROUP', 'GROUP', ARGV[1], ARGV[2], 'COUNT', 1, 'STREAMS', KEYS[1], '>')
+if not resposta then
+    return 2
+end
+local entrada = resposta[1][2][1]
+return {entrada[1], entrada[2][2]}
+"""
+
+_VAZIO = 0
+
+# Confirma e remove o job; se o usuário ainda tem jobs, avisa os workers
+# (ele pode ter saído do limite de jobs em andamento)
+# KEYS: stream, sinal | ARGV: grupo, entry_id, tamanho máximo do sinal
+_SCRIPT_CONFIRMAR = """
+redis.call('XACK', KEYS[1], ARGV[1], ARGV[2])
+redis.call('XDEL', KEYS[1], ARGV[2])
+if redis.call('XLEN', KEYS[1]) > 0 then
+    redis.call('RPUSH', KEYS[2], '1')
+    redis.call('LTRIM', KEYS[2], -tonumber(ARGV[3]), -1)
+end
+"""
+
+# Devolve ao fim da sub-fila um job que não terminou (encerramento do worker),
+# se a entrada ainda estiver pendente (não foi reivindicada e tratada por outro)
+# KEYS: stream, sinal | ARGV: grupo, entry_id, job, tamanho máximo do sinal
+# Retorna 1 se devolveu, 0 se a entrada já não estava pendente
+_SCRIPT_DEVOLVER = """
+if redis.call('XACK', KEYS[1], ARGV[1], ARGV[2]) == 0 then
+    return 0
+end
+redis.call('XDEL', KEYS[1], ARGV[2])
+redis.call('XADD', KEYS[1], '*', 'job', ARGV[3])
+redis.call('RPUSH', KEYS[2], '1')
+redis.call('LTRIM', KEYS[2], -tonumber(ARGV[4]), -1)
+return 1
+"""
+
+
+def nome_consumidor() -> str:
+    """Nome único do consumidor (host + pid)"""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def chave_ativos(prioridade: str) -> str:
+    """Conjunto de streams de usuários com jobs na faixa"""
+    return f"{PREFIXO_ATIVOS}{prioridade}"
+
+
+def identificar_usuario(job_data: dict) -> str:
+    """Dono do job para o rodízio: user_id (autenticado) ou IP (anônimo)"""
+    return job_data.get('user_id') or job_data.get('ip_address') or 'desconhecido'
+
+
+def tempo_na_fila(entry_id) -> float:
+    """
+    Tempo (ms) desde que o job entrou no stream: o ID da entrada traz o
+    horário do XADD (inclui novas tentativas e devoluções)
+    """
+    if isinstance(entry_id, bytes):
+        entry_id = entry_id.decode()
+    enfileirado_ms = int(entry_id.split('-', 1)[0])
+    return max(0.0, time.time() * 1000 - enfileirado_ms)
+
+
+def definir_prioridade(is_authenticated: bool, plano: str = None, planos_premium=(PRIORIDADE_PREMIUM,)) -> str:
+    """
+    Faixa do job a partir do usuário que enviou
+
+    Args:
+        is_authenticated: Usuário logado?
+        plano: Plano do usuário (gratuito, premium, ...)
+        planos_premium: Planos que vão para a faixa premium
+    """
+    if not is_authenticated:
+        return PRIORIDADE_ANONIMO
+    if plano in planos_premium:
+        return PRIORIDADE_PREMIUM
+    return PRIORIDADE_AUTENTICADO
+
+
+class FilaJobs:
+    """Fila de jobs (envelopes binários) em Redis Streams por faixa e usuário (cliente redis.asyncio)"""
+
+    def __init__(self, redis_conn, pesos: dict = None, max_por_usuario: int = 2, grupo: str = GRUPO_WORKERS):
+        self.redis_conn = redis_conn
+        self.grupo = grupo
+        self.max_por_usuario = max(1, max_por_usuario)
+        self.pesos = {p: max(1, int(w)) for p, w in (pesos or PESOS_PADRAO).items()}
+
+        # Faixas em ordem de peso (usada para desempate e reivindicação)
+        self.prioridades = sorted(self.pesos, key=self.pesos.get, reverse=True)
+        self._creditos = {p: 0 for p in self.pesos}
+
+        # Rodízio local de usuários por faixa
+        self._rodizio = {p: deque() for p in self.pesos}
+        self._proxima_atualizacao = {p: 0 for p in self.pesos}
+
+        self._enfileirar = redis_conn.register_script(SCRIPT_ENFILEIRAR)
+        self._ler_usuario = redis_conn.register_script(_SCRIPT_LER_USUARIO)
+        self._confirmar = redis_conn.register_script(_SCRIPT_CONFIRMAR)
+        self._devolver = redis_conn.register_script(_SCRIPT_DEVOLVER)
+
+    def prioridade_valida(self, prioridade: str) -> str:
+        """Prioridade desconhecida cai na faixa de autenticados"""
+        if prioridade in self.pesos:
+            return prioridade
+        return PRIORIDADE_AUTENTICADO if PRIORIDADE_AUTENTICADO in self.pesos else self.prioridades[0]
+
+    def stream_do_job(self, job_data: dict) -> str:
+        """Stream (sub-fila do usuário) onde o job deve ficar"""
+        prioridade = self.prioridade_valida(job_data.get('prioridade'))
+        return f"{STREAM_JOBS}:{prioridade}:{identificar_usuario(job_data)}"
+
+    async def enfileirar(self, job_bytes: bytes, job_data: dict) -> str:
+        """Adiciona o job na sub-fila do usuário e retorna o ID da entrada"""
+        prioridade = self.prioridade_valida(job_data.get('prioridade'))
+        entry_id = await self._enfileirar(
+            keys=[self.stream_do_job(job_data), chave_ativos(prioridade), LISTA_SINAL],
+            args=[self.grupo, job_bytes, TAMANHO_MAXIMO_SINAL]
+        )
+        return entry_id.decode() if isinstance(entry_id, bytes) else entry_id
+
+    async def ler(self, consumidor: str) -> list:
+        """
+        Lê o próximo job para o consumidor (fica pendente até confirmar)
+        Tenta as faixas na ordem do round-robin ponderado e, em cada faixa, os
+        usuários em rodízio. Não bloqueia (ver aguardar_sinal)
+
+        Returns:
+            Lista com no máximo um (stream, entry_id, job_bytes)
+        """
+        for prioridade in self._ordem_faixas():
+            job = await self._ler_faixa(prioridade, consumidor)
+            if job:
+                return [job]
+        return []
+
+    async def aguardar_sinal(self, bloquear_ms: int = 5000) -> bool:
+        """
+        Espera aviso de job novo (ou de usuário que saiu do limite)
+        Pode ser cancelado a qualquer momento sem perder jobs
+
+        Returns:
+            True se chegou aviso antes do timeout
+        """
+        sinal = await self.redis_conn.blpop(LISTA_SINAL, timeout=max(1, bloquear_ms // 1000))
+        return sinal is not None
+
+    async def reivindicar(self, consumidor: str, ocioso_ms: int, quantidade: int = 1) -> list:
+        """
+        Assume jobs pendentes há mais de ocioso_ms (consumidor morreu no meio)
+        Percorre as faixas da maior para a menor prioridade
+
+        Returns:
+            Lista de (stream, entry_id, job_bytes)
+        """
+        for prioridade in self.prioridades:
+            for stream in await self._usuarios_ativos(prioridade):
+                jobs = await self._reivindicar_stream(stream, consumidor, ocioso_ms, quantidade)
+                if jobs:
+                    return jobs
+        return []
+
+    async def confirmar(self, stream: str, entry_id: str):
+        """Confirma o job processado e remove a entrada do stream"""
+        await self._confirmar(keys=[stream, LISTA_SINAL], args=[self.grupo, entry_id, TAMANHO_MAXIMO_SINAL])
+
+    async def devolver(self, stream: str, entry_id: str, job_bytes: bytes) -> bool:
+        """
+        Devolve o job à sub-fila (fica disponível para outro worker na hora)
+
+        Returns:
+            False se a entrada já tinha sido reivindicada e tratada por outro worker
+        """
+        devolvido = await self._devolver(
+            keys=[stream, LISTA_SINAL],
+            args=[self.grupo, entry_id, job_bytes, TAMANHO_MAXIMO_SINAL]
+        )
+        return bool(devolvido)
+
+    async def pendente(self, stream: str, entry_id: str) -> bool:
+        """A entrada ainda está pendente no grupo (não foi confirmada por ninguém)?"""
+        try:
+            pendentes = await self.redis_conn.xpending_range(stream, self.grupo, min=entry_id, max=entry_id, count=1)
+        except ResponseError:
+            # Stream do usuário já removido (esvaziou)
+            return False
+        return bool(pendentes)
+
+    async def renovar(self, consumidor: str, entradas) -> None:
+        """
+        Zera o tempo ocioso das entradas em andamento (XCLAIM JUSTID), para que
+        não sejam reivindicadas enquanto o job ainda roda (ex.: esperando o OCR)
+
+        Args:
+            entradas: Pares (stream, entry_id) do consumidor
+        """
+        pipe = self.redis_conn.pipeline(transaction=False)
+        for stream, entry_id in entradas:
+            pipe.xclaim(stream, self.grupo, consumidor, 0, [entry_id], justid=True)
+        # Entrada já confirmada ou stream removido: nada a renovar
+        await pipe.execute(raise_on_error=False)
+
+    async def tamanho(self) -> dict:
+        """Jobs por faixa (ainda não lidos + pendentes de confirmação)"""
+        tamanhos = {}
+        for prioridade in self.prioridades:
+            pipe = self.redis_conn.pipeline()
+            for stream in await self._usuarios_ativos(prioridade):
+                pipe.xlen(stream)
+            tamanhos[prioridade] = sum(await pipe.execute())
+        return tamanhos
+
+    async def migrar_fila_legada(self) -> int:
+        """
+        Move para as sub-filas dos usuários os jobs da lista antiga (boletos:jobs)
+        Cobre API em versão anterior durante o deploy
+
+        Returns:
+            Quantidade de jobs migrados
+        """
+        migrados = 0
+        while True:
+            job_bytes = await self.redis_conn.lpop(FILA_LEGADA)
+            if job_bytes is None:
+                break
+            await self._redirecionar(job_bytes)
+            migrados += 1
+
+        if migrados:
+            logger.info(f"📦 {migrados} job(s) migrado(s) da fila antiga para as sub-filas por usuário")
+
+        return migrados
+
+    async def _ler_faixa(self, prioridade: str, consumidor: str):
+        """
+        Próximo job da faixa: um por usuário, em rodízio
+        Usuário no limite de jobs em andamento é pulado (volta na próxima rodada)
+        """
+        rodizio = self._rodizio[prioridade]
+        await self._atualizar_rodizio(prioridade)
+
+        for _ in range(len(rodizio)):
+            stream = rodizio.popleft()
+            resultado = await self._ler_usuario(
+                keys=[stream, chave_ativos(prioridade)],
+                args=[self.grupo, consumidor, self.max_por_usuario]
+            )
+
+            if resultado == _VAZIO:
+                continue
+
+            rodizio.append(stream)
+            if isinstance(resultado, list):
+                entry_id, job_bytes = resultado
+                if isinstance(entry_id, bytes):
+                    entry_id = entry_id.decode()
+                return (stream, entry_id, job_bytes)
+
+        return None
+
+    async def _atualizar_rodizio(self, prioridade: str):
+        """Inclui no fim do rodízio os usuários que entraram na faixa"""
+        loop = asyncio.get_running_loop()
+        rodizio = self._rodizio[prioridade]
+        if rodizio and loop.time() < self._proxima_atualizacao[prioridade]:
+            return
+
+        conhecidos = set(rodizio)
+        for stream in await self._usuarios_ativos(prioridade):
+            if stream not in conhecidos:
+                rodizio.append(stream)
+        self._proxima_atualizacao[prioridade] = loop.time() + INTERVALO_RODIZIO
+
+    async def _usuarios_ativos(self, prioridade: str) -> list:
+        membros = await self.redis_conn.smembers(chave_ativos(prioridade))
+        return [m.decode() if isinstance(m, bytes) else m for m in membros]
+
+    async def _reivindicar_stream(self, stream: str, consumidor: str, ocioso_ms: int, quantidade: int) -> list:
+        try:
+            resposta = await self.redis_conn.xautoclaim(
+                stream,
+                self.grupo,
+                consumidor,
+                min_idle_time=ocioso_ms,
+                start_id='0-0',
+                count=quantidade
+            )
+        except ResponseError:
+            # Stream do usuário removido entre a listagem e a reivindicação
+            return []
+
+        mensagens = resposta[1]
+        if mensagens:
+            logger.warning(f"♻️ {len(mensagens)} job(s) pendente(s) reivindicado(s) de {stream}")
+        return self._extrair(stream, mensagens)
+
+    async def _redirecionar(self, job_bytes: bytes):
+        """Enfileira um job antigo na sub-fila do usuário"""
+        try:
+            job_data, _ = desempacotar_job(job_bytes)
+        except Exception:
+            # Envelope inválido: o worker registra o erro ao processar
+            job_data = {}
+
+        if not job_data.get('prioridade'):
+            job_data = {**job_data, 'prioridade': definir_prioridade(job_data.get('is_authenticated', False))}
+        await self.enfileirar(job_bytes, job_data)
+
+    def _ordem_faixas(self) -> list:
+        """
+        Round-robin ponderado suave (como no nginx): a faixa escolhida vem
+        primeiro, as outras seguem por peso para quando ela estiver vazia
+        """
+        total = sum(self.pesos.values())
+        for prioridade, peso in self.pesos.items():
+            self._creditos[prioridade] += peso
+
+        escolhida = max(self.prioridades, key=self._creditos.get)
+        self._creditos[escolhida] -= total
+
+        return [escolhida] + [p for p in self.prioridades if p != escolhida]
+
+    @staticmethod
+    def _extrair(stream: str, mensagens) -> list:
+        """Converte [(id, {campo: valor})] em [(stream, id, job_bytes)], ignorando entradas apagadas"""
+        jobs = []
+        for entry_id, campos in mensagens:
+            if not campos or CAMPO_JOB not in campos:
+                continue
+            if isinstance(entry_id, bytes):
+                entry_id = entry_id.decode()
+            jobs.append((stream, entry_id, campos[CAMPO_JOB]))
+        return jobs
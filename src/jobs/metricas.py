@@ -0,0 +1,217 @@
+"""
+Métricas no formato texto do Prometheus (sem dependências externas)
+Cada processo (API, worker) tem seu registro; os valores ficam em memória e
+são exportados a cada coleta (endpoint /metrics)
+"""
+
+import asyncio
+import logging
+import math
+import threading
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Limites dos histogramas de duração (segundos)
+BUCKETS_PADRAO = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _formatar_valor(valor: float) -> str:
+    if math.isinf(valor):
+        return '+Inf' if valor > 0 else '-Inf'
+    if float(valor).is_integer():
+        return str(int(valor))
+    return repr(float(valor))
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _formatar_rotulos(nomes, valores, extra: str = '') -> str:
+    pares = [f'{nome}="{_escapar(valor)}"' for nome, valor in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return '{' + ','.join(pares) + '}' if pares else ''
+
+
+class _Metrica:
+    tipo = ''
+
+    def __init__(self, nome: str, descricao: str, rotulos=()):
+        self.nome = nome
+        self.descricao = descricao
+        self.rotulos = tuple(rotulos)
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def _chave(self, rotulos: dict) -> tuple:
+        return tuple(str(rotulos.get(nome, '')) for nome in self.rotulos)
+
+    def exportar(self) -> list:
+        linhas = [
+            f"# HELP {self.nome} {self.descricao}",
+            f"# TYPE {self.nome} {self.tipo}"
+        ]
+        with self._lock:
+            itens = sorted(self._valores.items())
+        for chave, valor in itens:
+            linhas.extend(self._linhas(chave, valor))
+        return linhas
+
+    def _linhas(self, chave, valor) -> list:
+        return [f"{self.nome}{_formatar_rotulos(self.rotulos, chave)} {_formatar_valor(valor)}"]
+
+
+class Contador(_Metrica):
+    """Total que só cresce (eventos, erros)"""
+    tipo = 'counter'
+
+    def inc(self, valor: float = 1, **rotulos):
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+    def definir(self, valor: float, **rotulos):
+        """Copia um total mantido em outro lugar (ex.: contadores do cache)"""
+        with self._lock:
+            self._valores[self._chave(rotulos)] = valor
+
+
+class Medidor(_Metrica):
+    """Valor instantâneo (tamanho da fila, jobs em andamento)"""
+    tipo = 'gauge'
+
+    def definir(self, valor: float, **rotulos):
+        with self._lock:
+            self._valores[self._chave(rotulos)] = valor
+
+
+class Histograma(_Metrica):
+    """Distribuição de durações (buckets acumulados, soma e contagem)"""
+    tipo = 'histogram'
+
+    def __init__(self, nome: str, descricao: str, rotulos=(), buckets=BUCKETS_PADRAO):
+        super().__init__(nome, descricao, rotulos)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observar(self, valor: float, **rotulos):
+        chave = self._chave(rotulos)
+        with self._lock:
+            contagens, soma = self._valores.get(chave, ([0] * len(self.buckets), 0.0))
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    contagens[i] += 1
+            self._valores[chave] = (contagens, soma + valor)
+
+    def _linhas(self, chave, valor) -> list:
+        contagens, soma = valor
+        linhas = []
+        for limite, contagem in zip(self.buckets, contagens):
+            le = 'le="' + _formatar_valor(limite) + '"'
+            linhas.append(f"{self.nome}_bucket{_formatar_rotulos(self.rotulos, chave, le)} {contagem}")
+        rotulos = _formatar_rotulos(self.rotulos, chave)
+        linhas.append(f"{self.nome}_sum{rotulos} {_formatar_valor(soma)}")
+        linhas.append(f"{self.nome}_count{rotulos} {contagens[-1]}")
+        return linhas
+
+
+class Registro:
+    """Métricas de um processo"""
+
+    def __init__(self):
+        self._metricas = []
+
+    def contador(self, nome: str, descricao: str, rotulos=()) -> Contador:
+        return self._adicionar(Contador(nome, descricao, rotulos))
+
+    def medidor(self, nome: str, descricao: str, rotulos=()) -> Medidor:
+        return self._adicionar(Medidor(nome, descricao, rotulos))
+
+    def histograma(self, nome: str, descricao: str, rotulos=(), buckets=BUCKETS_PADRAO) -> Histograma:
+        return self._adicionar(Histograma(nome, descricao, rotulos, buckets))
+
+    def exportar(self) -> str:
+        """Todas as métricas no formato texto do Prometheus"""
+        linhas = []
+        for metrica in self._metricas:
+            linhas.extend(metrica.exportar())
+        return '\n'.join(linhas) + '\n'
+
+    def _adicionar(self, metrica):
+        self._metricas.append(metrica)
+        return metrica
+
+
+class MetricasFila:
+    """Métricas da fila e do cache de OCR, comuns à API e ao worker"""
+
+    def __init__(self, registro: Registro):
+        self.tamanho_fila = registro.medidor(
+            'boletos_fila_jobs', 'Jobs na fila por faixa (não lidos + em andamento)', ['prioridade']
+        )
+        self.retry_pendentes = registro.medidor(
+            'boletos_fila_retry_jobs', 'Jobs aguardando nova tentativa'
+        )
+        self.dlq = registro.medidor('boletos_fila_dlq_jobs', 'Jobs na fila de jobs mortos (DLQ)')
+        self.cache_ocr = registro.contador(
+            'boletos_cache_ocr_total', 'Consultas ao cache de OCR deste processo', ['resultado']
+        )
+        self.cache_ocr_taxa = registro.medidor(
+            'boletos_cache_ocr_taxa_acerto', 'Taxa de acerto do cache de OCR deste processo'
+        )
+
+    async def atualizar(self, fila, retry):
+        """Lê os tamanhos no Redis e os contadores do cache de OCR"""
+        from ml.ocr_pool import estatisticas_cache_ocr
+
+        try:
+            for prioridade, tamanho in (await fila.tamanho()).items():
+                self.tamanho_fila.definir(tamanho, prioridade=prioridade)
+            self.retry_pendentes.definir(await retry.pendentes(fila.prioridades))
+            self.dlq.definir(await retry.tamanho_dlq())
+        except Exception as e:
+            logger.warning(f"Métricas: erro ao ler a fila: {str(e)}")
+
+        stats = estatisticas_cache_ocr()
+        if stats:
+            self.cache_ocr.definir(stats['hits_memoria'], resultado='hit_memoria')
+            self.cache_ocr.definir(stats['hits_redis'], resultado='hit_redis')
+            self.cache_ocr.definir(stats['misses'], resultado='miss')
+            self.cache_ocr_taxa.definir(stats['taxa_acerto'])
+
+
+async def servir_metricas(porta: int, coletar, host: str = '0.0.0.0'):
+    """
+    Servidor HTTP mínimo (sidecar) que responde com as métricas a qualquer GET
+
+    Args:
+        porta: Porta TCP
+        coletar: Corrotina que retorna o texto das métricas
+
+    Returns:
+        asyncio.Server (fechar com close() + wait_closed())
+    """
+    async def responder(reader, writer):
+        try:
+            requisicao = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), timeout=5)
+            if requisicao.startswith(b'GET '):
+                status, corpo = '200 OK', (await coletar()).encode()
+            else:
+                status, corpo = '405 Method Not Allowed', b''
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                f"Content-Type: {CONTENT_TYPE}\r\n"
+                f"Content-Length: {len(corpo)}\r\n"
+                f"Connection: close\r\n\r\n".encode() + corpo
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except Exception as e:
+            logger.warning(f"Métricas: erro ao responder: {str(e)}")
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(responder, host, porta)
@@ -0,0 +1,157 @@
+"""
+Agendador de novas tentativas com backoff exponencial + fila de jobs mortos
+Jobs que falharam esperam num sorted set por faixa de prioridade (score =
+horário da nova tentativa) e voltam à sub-fila do usuário quando vencem;
+esgotadas as tentativas, vão para a DLQ
+"""
+
+import json
+import logging
+import random
+import time
+from datetime import datetime
+
+from jobs.envelope import empacotar_job
+from jobs.fila import (
+    GRUPO_WORKERS, LISTA_SINAL, TAMANHO_MAXIMO_SINAL,
+    PRIORIDADE_AUTENTICADO, chave_ativos
+)
+
+logger = logging.getLogger(__name__)
+
+# Prefixo dos sorted sets por faixa
+ZSET_RETRY = 'boletos:jobs:retry'
+LISTA_DLQ = 'boletos:jobs:dead'
+
+# Entradas mantidas na DLQ (as mais antigas são descartadas)
+TAMANHO_MAXIMO_DLQ = 10000
+
+# Separa o stream de destino do envelope no membro do sorted set
+SEPARADOR = b'|'
+
+# Move atomicamente os jobs vencidos do sorted set para a sub-fila do usuário
+# (membro = stream + SEPARADOR + envelope)
+# KEYS: sorted set, ativos da faixa, sinal
+# ARGV: agora, limite, grupo, tamanho máximo do sinal
+_SCRIPT_MOVER_VENCIDOS = """
+local vencidos = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, membro in ipairs(vencidos) do
+    redis.call('ZREM', KEYS[1], membro)
+    local separador = string.find(membro, '|', 1, true)
+    local stream = string.sub(membro, 1, separador - 1)
+    redis.pcall('XGROUP', 'CREATE', stream, ARGV[3], '0', 'MKSTREAM')
+    redis.call('XADD', stream, '*', 'job', string.sub(membro, separador + 1))
+    redis.call('SADD', KEYS[2], stream)
+    redis.call('RPUSH', KEYS[3], '1')
+end
+redis.call('LTRIM', KEYS[3], -tonumber(ARGV[4]), -1)
+return #vencidos
+"""
+
+
+def calcular_atraso(tentativa: int, base: float, maximo: float) -> float:
+    """
+    Backoff exponencial com jitter: metade fixa + metade aleatória
+    do atraso base * 2^(tentativa-1), limitado a maximo
+    """
+    atraso = min(maximo, base * (2 ** (tentativa - 1)))
+    return atraso / 2 + random.uniform(0, atraso / 2)
+
+
+class AgendadorRetry:
+    """Novas tentativas (sorted set) e fila de jobs mortos (lista), com cliente redis.asyncio"""
+
+    def __init__(self, redis_conn, max_tentativas: int = 3, base: float = 10, maximo: float = 300):
+        self.redis_conn = redis_conn
+        self.max_tentativas = max_tentativas
+        self.base = base
+        self.maximo = maximo
+        self._mover = redis_conn.register_script(_SCRIPT_MOVER_VENCIDOS)
+
+    def pode_tentar_novamente(self, job_data: dict) -> bool:
+        """Ainda restam tentativas para o job?"""
+        return job_data.get('tentativa', 1) < self.max_tentativas
+
+    async def agendar(self, job_data: dict, corpo: bytes, erro: str, stream: str) -> float:
+        """
+        Agenda nova tentativa do job
+
+        Args:
+            job_data: Metadados do envelope
+            corpo: Corpo do envelope (vazio quando o arquivo está no blob store)
+            erro: Mensagem da última falha
+            stream: Sub-fila do usuário onde o job volta
+
+        Returns:
+            Atraso em segundos até a nova tentativa
+        """
+        tentativa = job_data.get('tentativa', 1)
+        atraso = calcular_atraso(tentativa, self.base, self.maximo)
+
+        novo = {**job_data, 'tentativa': tentativa + 1, 'ultimo_erro': erro}
+        prioridade = job_data.get('prioridade', PRIORIDADE_AUTENTICADO)
+        membro = stream.encode() + SEPARADOR + empacotar_job(novo, corpo)
+        await self.redis_conn.zadd(self._zset(prioridade), {membro: time.time() + atraso})
+
+        logger.warning(
+            f"🔁 {job_data.get('analise_id')} - tentativa {tentativa + 1}/{self.max_tentativas} "
+            f"em {atraso:.1f}s"
+        )
+        return atraso
+
+    async def mover_vencidos(self, prioridades, limite: int = 100) -> int:
+        """
+        Devolve à sub-fila do usuário os jobs cuja nova tentativa já venceu
+
+        Args:
+            prioridades: Faixas de prioridade
+            limite: Máximo de jobs movidos por faixa
+
+        Returns:
+            Quantidade de jobs movidos
+        """
+        agora = time.time()
+        movidos = 0
+
+        for prioridade in prioridades:
+            movidos += await self._mover(
+                keys=[self._zset(prioridade), chave_ativos(prioridade), LISTA_SINAL],
+                args=[agora, limite, GRUPO_WORKERS, TAMANHO_MAXIMO_SINAL]
+            )
+
+        if movidos:
+            logger.info(f"🔁 {movidos} job(s) devolvido(s) à fila para nova tentativa")
+        return movidos
+
+    async def enviar_dlq(self, job_data: dict, erro: str):
+        """Registra o job que esgotou as tentativas na fila de jobs mortos"""
+        registro = {
+            **job_data,
+            'ultimo_erro': erro,
+            'falhou_em': datetime.utcnow().isoformat()
+        }
+
+        pipe = self.redis_conn.pipeline()
+        pipe.lpush(LISTA_DLQ, json.dumps(registro))
+        pipe.ltrim(LISTA_DLQ, 0, TAMANHO_MAXIMO_DLQ - 1)
+        await pipe.execute()
+
+        logger.error(
+            f"💀 {job_data.get('analise_id')} - enviado para a DLQ após "
+            f"{job_data.get('tentativa', 1)} tentativa(s): {erro}"
+        )
+
+    async def pendentes(self, prioridades) -> int:
+        """Jobs aguardando nova tentativa (todas as faixas)"""
+        pipe = self.redis_conn.pipeline()
+        for prioridade in prioridades:
+            pipe.zcard(self._zset(prioridade))
+        return sum(await pipe.execute())
+
+    async def tamanho_dlq(self) -> int:
+        """Jobs na fila de jobs mortos"""
+        return await self.redis_conn.llen(LISTA_DLQ)
+
+    @staticmethod
+    def _zset(prioridade: str) -> str:
+        return f"{ZSET_RETRY}:{prioridade}"
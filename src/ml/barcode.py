@@ -0,0 +1,196 @@
+"""
+Leitura do código de barras (Interleaved 2 of 5) direto da imagem, só com NumPy
+Dispensa o OCR para código de barras e linha digitável quando a leitura dá certo
+"""
+
+import logging
+import numpy as np
+from PIL import Image
+
+from ml.validator import calcular_dv_modulo10, calcular_dv_modulo11
+
+logger = logging.getLogger(__name__)
+
+# Código de barras do boleto: 44 dígitos = 22 pares intercalados
+DIGITOS_CODIGO = 44
+# Início (4 elementos) + 22 pares x 10 elementos + fim (3 elementos)
+ELEMENTOS_CODIGO = 4 + (DIGITOS_CODIGO // 2) * 10 + 3
+# Cada dígito tem 2 elementos largos, mais 1 largo no fim
+ELEMENTOS_LARGOS = DIGITOS_CODIGO * 2 + 1
+
+# Padrões ITF (1 = largo), do dígito 0 ao 9
+PADROES_ITF = {
+    0: (0, 0, 1, 1, 0),
+    1: (1, 0, 0, 0, 1),
+    2: (0, 1, 0, 0, 1),
+    3: (1, 1, 0, 0, 0),
+    4: (0, 0, 1, 0, 1),
+    5: (1, 0, 1, 0, 0),
+    6: (0, 1, 1, 0, 0),
+    7: (0, 0, 0, 1, 1),
+    8: (1, 0, 0, 1, 0),
+    9: (0, 1, 0, 1, 0)
+}
+
+# Tabela de consulta: padrão de 5 bits -> dígito (-1 = inválido)
+_PESOS_BITS = np.array([16, 8, 4, 2, 1])
+_TABELA_ITF = np.full(32, -1, dtype=np.int8)
+for _digito, _padrao in PADROES_ITF.items():
+    _TABELA_ITF[int(np.dot(_padrao, _PESOS_BITS))] = _digito
+
+# Quantidade de linhas da imagem amostradas
+LINHAS_AMOSTRADAS = 80
+
+# Contraste mínimo (0-255) para considerar uma linha de pixels
+CONTRASTE_MINIMO = 60
+
+
+def ler_codigo_barras(imagem: Image.Image) -> str:
+    """
+    Procura e decodifica o código de barras ITF do boleto
+
+    Args:
+        imagem: Imagem PIL do boleto
+
+    Returns:
+        Código de barras (44 dígitos) com DV módulo 11 válido, ou None
+    """
+
+    matriz = np.asarray(imagem.convert('L'))
+
+    # Horizontal primeiro; vertical cobre fotos giradas em 90°
+    for orientacao in (matriz, matriz.T):
+        codigo = _varrer_linhas(orientacao)
+        if codigo:
+            logger.info(f"✅ Código de barras lido da imagem: {codigo}")
+            return codigo
+
+    logger.info("Código de barras não encontrado na imagem")
+    return None
+
+
+def _varrer_linhas(matriz: np.ndarray) -> str:
+    """
+    Tenta decodificar linhas amostradas, de baixo para cima
+    (a ficha de compensação fica no fim da página)
+    """
+
+    altura = matriz.shape[0]
+    indices = np.unique(np.linspace(0, altura - 1, min(LINHAS_AMOSTRADAS, altura)).astype(int))
+
+    for indice in indices[::-1]:
+        pixels = matriz[indice]
+
+        # Leitura nos dois sentidos (imagem de cabeça para baixo)
+        for sentido in (pixels, pixels[::-1]):
+            codigo = decodificar_linha(sentido)
+            if codigo:
+                return codigo
+
+    return None
+
+
+def decodificar_linha(pixels: np.ndarray) -> str:
+    """
+    Decodifica uma linha de pixels em escala de cinza
+
+    Returns:
+        Código de 44 dígitos, se encontrado e com DV válido; senão None
+    """
+
+    minimo, maximo = int(pixels.min()), int(pixels.max())
+    if maximo - minimo < CONTRASTE_MINIMO:
+        return None
+
+    escuro = pixels < (minimo + maximo) / 2
+
+    # Run-length: larguras das barras/espaços e cor de cada trecho
+    mudancas = np.flatnonzero(escuro[1:] != escuro[:-1]) + 1
+    inicios = np.concatenate(([0], mudancas))
+    larguras = np.diff(np.concatenate((inicios, [len(escuro)])))
+    barras = escuro[inicios]
+
+    if len(larguras) < ELEMENTOS_CODIGO + 2:
+        return None
+
+    # Candidatos: barra precedida de zona de silêncio (espaço largo)
+    ultimo = len(larguras) - ELEMENTOS_CODIGO
+    posicoes = np.arange(1, ultimo + 1)
+    candidatos = posicoes[
+        barras[posicoes]
+        & (larguras[posicoes - 1] >= 5 * larguras[posicoes])
+    ]
+
+    for inicio in candidatos:
+        codigo = _decodificar_janela(larguras[inicio:inicio + ELEMENTOS_CODIGO])
+        if codigo:
+            return codigo
+
+    return None
+
+
+def _decodificar_janela(larguras: np.ndarray) -> str:
+    """
+    Decodifica exatamente os elementos de um código ITF de 44 dígitos
+    (início + pares + fim), começando por uma barra
+    """
+
+    # Limiar entre estreito e largo: entre o maior estreito e o menor largo
+    ordenadas = np.sort(larguras)
+    corte = len(larguras) - ELEMENTOS_LARGOS
+    maior_estreito, menor_largo = ordenadas[corte - 1], ordenadas[corte]
+    if menor_largo < maior_estreito * 1.5:
+        return None
+
+    largos = larguras > (maior_estreito + menor_largo) / 2
+
+    # Início: estreito, estreito, estreito, estreito; fim: largo, estreito, estreito
+    if largos[:4].any() or not largos[-3] or largos[-2] or largos[-1]:
+        return None
+
+    pares = largos[4:-3].reshape(-1, 10).astype(int)
+    primeiros = _TABELA_ITF[pares[:, 0::2] @ _PESOS_BITS]
+    segundos = _TABELA_ITF[pares[:, 1::2] @ _PESOS_BITS]
+
+    if (primeiros < 0).any() or (segundos < 0).any():
+        return None
+
+    codigo = ''.join(f"{a}{b}" for a, b in zip(primeiros, segundos))
+
+    if not codigo_barras_valido(codigo):
+        return None
+
+    return codigo
+
+
+def codigo_barras_valido(codigo: str) -> bool:
+    """
+    Confere o DV geral (posição 5, módulo 11) de um código de boleto bancário
+    """
+
+    if len(codigo) != DIGITOS_CODIGO or codigo[0] == '8':
+        # Iniciados em 8 são de arrecadação (outra regra de DV)
+        return False
+
+    return codigo[4] == calcular_dv_modulo11(codigo[:4] + codigo[5:])
+
+
+def linha_digitavel_de_codigo_barras(codigo: str) -> str:
+    """
+    Monta a linha digitável formatada a partir do código de barras
+    """
+
+    campo1 = codigo[0:4] + codigo[19:24]
+    campo2 = codigo[24:34]
+    campo3 = codigo[34:44]
+
+    campo1 += calcular_dv_modulo10(campo1)
+    campo2 += calcular_dv_modulo10(campo2)
+    campo3 += calcular_dv_modulo10(campo3)
+
+    return (
+        f"{campo1[0:5]}.{campo1[5:10]} "
+        f"{campo2[0:5]}.{campo2[5:11]} "
+        f"{campo3[0:5]}.{campo3[5:11]} "
+        f"{codigo[4]} {codigo[5:19]}"
+    )
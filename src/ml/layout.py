@@ -0,0 +1,124 @@
+"""
+Análise de layout - Localiza a faixa da linha digitável na imagem
+Permite rodar o OCR só no recorte em vez da página inteira
+"""
+
+import logging
+import cv2
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# A linha digitável tem 47 dígitos + separadores
+MIN_CARACTERES_LINHA = 35
+MAX_CARACTERES_LINHA = 90
+CARACTERES_ESPERADOS = 50
+
+
+def localizar_faixas_linha_digitavel(imagem: Image.Image, max_faixas: int = 3) -> list:
+    """
+    Localiza as faixas horizontais com maior chance de conter a linha digitável
+
+    Args:
+        imagem: Imagem PIL (idealmente já pré-processada)
+        max_faixas: Quantidade máxima de candidatas retornadas
+
+    Returns:
+        Lista de caixas (x, y, largura, altura), da mais provável para a menos provável
+    """
+
+    matriz = np.array(imagem.convert('L'))
+    altura_pagina, largura_pagina = matriz.shape
+
+    # Tinta = branco sobre preto
+    _, tinta = cv2.threshold(matriz, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+
+    # Componentes com formato de caractere
+    total, _, stats, _ = cv2.connectedComponentsWithStats(tinta, connectivity=8)
+    if total <= 1:
+        return []
+
+    larguras = stats[1:, cv2.CC_STAT_WIDTH]
+    alturas = stats[1:, cv2.CC_STAT_HEIGHT]
+    caracteres = (
+        (alturas >= 6)
+        & (alturas <= altura_pagina * 0.05)
+        & (larguras <= alturas * 1.5)
+    )
+    if caracteres.sum() < MIN_CARACTERES_LINHA:
+        return []
+
+    altura_caractere = int(np.median(alturas[caracteres]))
+
+    # Máscara só com caracteres, unidos horizontalmente em linhas de texto
+    mascara = np.zeros_like(tinta)
+    for x, y, w, h in stats[1:][caracteres][:, :4]:
+        mascara[y:y + h, x:x + w] = 255
+
+    kernel = cv2.getStructuringElement(
+        cv2.MORPH_RECT,
+        (max(3, altura_caractere * 2), max(1, altura_caractere // 4))
+    )
+    linhas = cv2.morphologyEx(mascara, cv2.MORPH_CLOSE, kernel)
+
+    contornos, _ = cv2.findContours(linhas, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    # Centros dos caracteres para contagem por faixa
+    centros_x = stats[1:][caracteres][:, 0] + stats[1:][caracteres][:, 2] // 2
+    centros_y = stats[1:][caracteres][:, 1] + stats[1:][caracteres][:, 3] // 2
+
+    candidatas = []
+    for contorno in contornos:
+        x, y, w, h = cv2.boundingRect(contorno)
+
+        # Faixa de uma linha de texto, larga
+        if h > altura_caractere * 2.5 or w < largura_pagina * 0.3:
+            continue
+
+        dentro = (
+            (centros_x >= x) & (centros_x < x + w)
+            & (centros_y >= y) & (centros_y < y + h)
+        )
+        quantidade = int(dentro.sum())
+
+        if not MIN_CARACTERES_LINHA <= quantidade <= MAX_CARACTERES_LINHA:
+            continue
+
+        candidatas.append((abs(quantidade - CARACTERES_ESPERADOS), y, (x, y, w, h)))
+
+    candidatas.sort()
+
+    faixas = [_expandir(caixa, altura_caractere, largura_pagina, altura_pagina)
+              for _, _, caixa in candidatas[:max_faixas]]
+
+    logger.info(f"Layout: {len(faixas)} faixa(s) candidata(s) para linha digitável")
+
+    return faixas
+
+
+def _expandir(caixa: tuple, margem: int, largura_pagina: int, altura_pagina: int) -> tuple:
+    """
+    Adiciona margem em volta da caixa (o Tesseract erra em recortes justos)
+    """
+
+    x, y, w, h = caixa
+    x0 = max(0, x - margem)
+    y0 = max(0, y - margem // 2)
+    x1 = min(largura_pagina, x + w + margem)
+    y1 = min(altura_pagina, y + h + margem // 2)
+
+    return (x0, y0, x1 - x0, y1 - y0)
+
+
+def caixa_ficha_compensacao(faixa_linha: tuple, largura_pagina: int, altura_pagina: int) -> tuple:
+    """
+    Região da ficha de compensação: da faixa da linha digitável (topo da ficha)
+    até o fim da página, com beneficiário, CNPJ, valor e vencimento
+
+    Returns:
+        Caixa (x, y, largura, altura)
+    """
+
+    _, y, _, _ = faixa_linha
+    return (0, y, largura_pagina, altura_pagina - y)
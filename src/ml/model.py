@@ -2,6 +2,7 @@
 Carrega e usa o modelo Random Forest para detecção de fraudes
 """
 
+import hashlib
 import pickle
 import pandas as pd
 import numpy as np
@@ -12,6 +13,7 @@ logger = logging.getLogger(__name__)
 
 # Cache do modelo
 _modelo_cache = None
+_versao_cache = {}
 
 
 def carregar_modelo(caminho: str = 'src/models/modelo_boleto.pkl'):
@@ -40,6 +42,17 @@ def carregar_modelo(caminho: str = 'src/models/modelo_boleto.pkl'):
         raise
 
 
+def versao_modelo(caminho: str = 'src/models/modelo_boleto.pkl') -> str:
+    """
+    Versão do modelo: hash do arquivo treinado (muda a cada novo treino)
+    """
+    if caminho not in _versao_cache:
+        with open(caminho, 'rb') as f:
+            _versao_cache[caminho] = hashlib.file_digest(f, 'sha256').hexdigest()[:16]
+    
+    return _versao_cache[caminho]
+
+
 def preparar_features(dados_extraidos: dict) -> dict:
     """
     Prepara features para o modelo a partir dos dados extraídos
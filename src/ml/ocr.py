@@ -5,10 +5,18 @@ OCR - Extração de texto usando Tesseract
 import pytesseract
 from PIL import Image
 import io
-import base64
 import logging
 import os
-from pdf2image import convert_from_bytes
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from pdf2image import convert_from_bytes, pdfinfo_from_bytes
+from pdf2image.exceptions import PDFPageCountError
+from ml.preprocess import preprocessar_imagem
+from ml.layout import localizar_faixas_linha_digitavel, caixa_ficha_compensacao
+from ml.barcode import ler_codigo_barras, linha_digitavel_de_codigo_barras
+from ml.parser import extrair_linha_digitavel
+from ml.validator import validar_linha_digitavel
 
 logger = logging.getLogger(__name__)
 
@@ -17,60 +25,443 @@ if os.name == 'nt':  # Windows
     pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
 
 
-def extrair_texto_tesseract(imagem_bytes: bytes, idioma: str = 'por') -> str:
+# Tesseract só com dígitos, uma linha de texto (recorte da linha digitável)
+CONFIG_LINHA_DIGITAVEL = '--psm 7 --oem 3 -c tessedit_char_whitelist=0123456789.'
+
+
+class OCRTimeoutError(Exception):
+    """Job de OCR excedeu o tempo máximo"""
+
+
+class ArquivoInvalidoError(Exception):
+    """Arquivo não é uma imagem nem um PDF legível (tentar de novo não adianta)"""
+
+
+class Prazo:
+    """
+    Tempo do job de OCR: cada processo tesseract/poppler recebe só o que
+    resta, então o job inteiro (todas as páginas e DPIs) termina no prazo
+    """
+    
+    def __init__(self, segundos: float = 0):
+        self.fim = time.monotonic() + segundos if segundos else None
+    
+    def esgotado(self) -> bool:
+        return self.fim is not None and time.monotonic() >= self.fim
+    
+    def restante(self) -> float:
+        """Segundos para o próximo processo (0 = sem limite)"""
+        if self.fim is None:
+            return 0
+        restante = self.fim - time.monotonic()
+        if restante <= 0:
+            raise OCRTimeoutError("Tempo de OCR esgotado")
+        return restante
+
+
+SEM_PRAZO = Prazo()
+
+
+def extrair_texto_tesseract(imagem_bytes: bytes, idioma: str = 'por', **opcoes) -> str:
     """
     Extrai texto de uma imagem ou PDF usando Tesseract OCR
     
     Args:
         imagem_bytes: Bytes da imagem ou PDF
         idioma: Idioma do OCR ('por' para português)
+        **opcoes: Ver extrair_texto_detalhado
     
     Returns:
         Texto extraído
     """
     
+    return extrair_texto_detalhado(imagem_bytes, idioma, **opcoes)['texto']
+
+
+def extrair_texto_detalhado(
+    imagem_bytes: bytes,
+    idioma: str = 'por',
+    timeout: int = 0,
+    preprocessamento: dict = None,
+    roi: bool = True,
+    texto_pdf: bool = True,
+    codigo_barras: bool = True,
+    max_paginas: int = 5,
+    paginas_paralelas: int = 2,
+    dpis_pdf: tuple = (150, 300)
+) -> dict:
+    """
+    Extrai texto de uma imagem ou PDF, informando como foi obtido
+    
+    Args:
+        imagem_bytes: Bytes da imagem ou PDF
+        idioma: Idioma do OCR ('por' para português)
+        timeout: Tempo máximo (segundos) do job inteiro (0 = sem limite); esgotado,
+            o PDF fica com o resultado da 1ª página, se houver
+        preprocessamento: Etapas de pré-processamento (ver ml.preprocess.OPCOES_PADRAO)
+        roi: Tentar primeiro o OCR só da faixa da linha digitável
+        texto_pdf: Em PDFs, usar a camada de texto embutida quando tiver linha digitável válida
+        codigo_barras: Tentar ler o código de barras da imagem antes do OCR
+        max_paginas: Páginas do PDF examinadas em busca da ficha de compensação
+        paginas_paralelas: Páginas do PDF renderizadas/OCR ao mesmo tempo
+        dpis_pdf: Escada de resoluções do PDF; a seguinte só é usada se a anterior falhar
+    
+    Returns:
+        {
+            'texto': str,
+            'metodo': 'texto_pdf' | 'codigo_barras' | 'roi_linha' | 'pagina_inteira',
+            'pagina': int (PDF) ou None,
+            'dpi': int (PDF rasterizado) ou None
+        }
+    """
+    
+    prazo = Prazo(timeout)
+    
     try:
-        logger.info("Iniciando OCR com Tesseract...")
+        if eh_pdf(imagem_bytes):
+            # PDF digital: texto embutido dispensa rasterização e Tesseract
+            if texto_pdf:
+                resultado = extrair_texto_pdf_nativo(imagem_bytes, prazo, max_paginas)
+                if resultado:
+                    return resultado
+            
+            logger.info("Detectado PDF, convertendo para imagem...")
+            return extrair_texto_pdf_rasterizado(
+                imagem_bytes,
+                idioma,
+                prazo,
+                preprocessamento,
+                roi,
+                codigo_barras,
+                max_paginas,
+                paginas_paralelas,
+                dpis_pdf
+            )
         
-        # Tentar abrir como imagem
+        logger.info("Iniciando OCR com Tesseract...")
         try:
             imagem = Image.open(io.BytesIO(imagem_bytes))
-        except Exception:
-            # Se falhar, tentar converter PDF para imagem
-            logger.info("Detectado PDF, convertendo para imagem...")
-            imagens = convert_from_bytes(imagem_bytes, first_page=1, last_page=1)
-            if not imagens:
-                raise Exception("Não foi possível converter PDF")
-            imagem = imagens[0]
+            # Open é preguiçoso: decodifica já para um arquivo truncado falhar aqui
+            imagem.load()
+        except (OSError, SyntaxError) as e:
+            raise ArquivoInvalidoError(f"Imagem ilegível: {str(e)}") from e
         
-        # Configuração do Tesseract
-        config = '--psm 6 --oem 3'
+        resultado = processar_imagem(imagem, idioma, prazo, preprocessamento, roi, codigo_barras)
+        resultado.update({'pagina': None, 'dpi': None})
+        return resultado
         
-        # Extrair texto
-        texto = pytesseract.image_to_string(
-            imagem,
-            lang=idioma,
-            config=config
+    except (OCRTimeoutError, ArquivoInvalidoError):
+        raise
+    except Exception as e:
+        if prazo.esgotado():
+            # tesseract/poppler interrompido pelo prazo
+            raise OCRTimeoutError(f"OCR excedeu {timeout}s: {str(e)}")
+        logger.error(f"❌ Erro no OCR: {str(e)}")
+        raise
+
+
+def eh_pdf(arquivo_bytes: bytes) -> bool:
+    """
+    Verifica a assinatura de PDF no início do arquivo
+    """
+    
+    return b'%PDF-' in arquivo_bytes[:1024]
+
+
+def tem_linha_digitavel_valida(texto: str) -> bool:
+    """
+    Verifica se o texto contém linha digitável com DVs válidos
+    """
+    
+    linha = extrair_linha_digitavel(texto)
+    return bool(linha) and validar_linha_digitavel(linha)['valido']
+
+
+def extrair_texto_pdf_nativo(pdf_bytes: bytes, prazo: Prazo = SEM_PRAZO, max_paginas: int = 5) -> dict:
+    """
+    Extrai a camada de texto das primeiras páginas do PDF com o pdftotext (poppler)
+    
+    Returns:
+        Resultado da primeira página com linha digitável válida; senão None
+        (PDF escaneado ou sem texto)
+    """
+    
+    try:
+        resultado = subprocess.run(
+            ['pdftotext', '-f', '1', '-l', str(max_paginas), '-layout', '-enc', 'UTF-8', '-', '-'],
+            input=pdf_bytes,
+            capture_output=True,
+            timeout=prazo.restante() or None
         )
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.warning(f"pdftotext indisponível ou travado: {str(e)}")
+        return None
+    
+    if resultado.returncode != 0:
+        logger.info("PDF sem camada de texto legível")
+        return None
+    
+    # pdftotext separa as páginas com form feed
+    paginas = resultado.stdout.decode('utf-8', errors='ignore').split('\f')
+    
+    for numero, pagina in enumerate(paginas, start=1):
+        texto = pagina.strip()
+        if texto and tem_linha_digitavel_valida(texto):
+            logger.info(f"✅ Texto extraído da camada do PDF, página {numero} ({len(texto)} caracteres)")
+            return {'texto': texto, 'metodo': 'texto_pdf', 'pagina': numero, 'dpi': None}
+    
+    logger.info("Camada de texto do PDF sem linha digitável válida, rasterizando")
+    return None
+
+
+def contar_paginas_pdf(pdf_bytes: bytes, prazo: Prazo = SEM_PRAZO) -> int:
+    """
+    Número de páginas do PDF (pdfinfo); 1 se não for possível descobrir
+    
+    Raises:
+        ArquivoInvalidoError: pdfinfo rodou mas não conseguiu ler o PDF
+    """
+    
+    try:
+        return int(pdfinfo_from_bytes(pdf_bytes, timeout=prazo.restante() or None)['Pages'])
+    except PDFPageCountError as e:
+        raise ArquivoInvalidoError(f"PDF ilegível: {str(e)}") from e
+    except Exception as e:
+        logger.warning(f"Não foi possível contar páginas do PDF: {str(e)}")
+        return 1
+
+
+def renderizar_pagina_pdf(pdf_bytes: bytes, pagina: int, dpi: int = 200, prazo: Prazo = SEM_PRAZO) -> Image.Image:
+    """
+    Renderiza uma página do PDF como imagem
+    """
+    
+    imagens = convert_from_bytes(
+        pdf_bytes,
+        dpi=dpi,
+        first_page=pagina,
+        last_page=pagina,
+        timeout=prazo.restante() or None
+    )
+    if not imagens:
+        raise Exception(f"Não foi possível converter a página {pagina} do PDF")
+    return imagens[0]
+
+
+def extrair_texto_pdf_rasterizado(
+    pdf_bytes: bytes,
+    idioma: str = 'por',
+    prazo: Prazo = SEM_PRAZO,
+    preprocessamento: dict = None,
+    roi: bool = True,
+    codigo_barras: bool = True,
+    max_paginas: int = 5,
+    paginas_paralelas: int = 2,
+    dpis_pdf: tuple = (150, 300)
+) -> dict:
+    """
+    Rasteriza o PDF subindo a escada de DPI: cada resolução só é tentada
+    se nenhuma página validou na resolução anterior e ainda houver prazo
+    
+    Returns:
+        Resultado da página com a ficha de compensação; se nenhuma tiver,
+        o da primeira página na maior resolução alcançada
+    """
+    
+    total = max(1, min(contar_paginas_pdf(pdf_bytes, prazo), max_paginas))
+    dpis = list(dpis_pdf) or [200]
+    primeira = None
+    
+    for indice, dpi in enumerate(dpis):
+        resultado, primeira_dpi = _procurar_ficha_paginas(
+            pdf_bytes, total, dpi, idioma, prazo, preprocessamento, roi, codigo_barras, paginas_paralelas
+        )
+        primeira = primeira_dpi or primeira
+        if resultado:
+            logger.info(f"✅ Ficha de compensação encontrada na página {resultado['pagina']} a {dpi} DPI")
+            return resultado
         
-        logger.info(f"✅ OCR concluído. {len(texto)} caracteres extraídos")
-        
-        return texto.strip()
+        if prazo.esgotado():
+            if primeira is None:
+                raise OCRTimeoutError("Tempo de OCR esgotado antes da primeira página")
+            logger.warning(f"⚠️ Tempo de OCR esgotado a {dpi} DPI, usando a primeira página")
+            return primeira
         
-    except Exception as e:
-        logger.error(f"❌ Erro no OCR: {str(e)}")
-        raise Exception(f"Erro ao extrair texto: {str(e)}")
+        if indice < len(dpis) - 1:
+            logger.info(f"Nenhuma página validou a {dpi} DPI, renderizando em {dpis[indice + 1]} DPI")
+    
+    if primeira is None:
+        raise Exception("Não foi possível converter PDF")
+    
+    logger.info("Nenhuma página com linha digitável válida, usando a primeira página")
+    return primeira
 
 
-def extrair_texto_de_base64(base64_string: str, idioma: str = 'por') -> str:
+def _procurar_ficha_paginas(
+    pdf_bytes: bytes,
+    total: int,
+    dpi: int,
+    idioma: str,
+    prazo: Prazo,
+    preprocessamento: dict,
+    roi: bool,
+    codigo_barras: bool,
+    paginas_paralelas: int
+) -> tuple:
     """
-    Extrai texto de uma imagem em base64
+    Faz OCR da página 1 e, se ela não tiver a ficha, das seguintes em paralelo
+    (pool limitado) numa resolução, parando na primeira página com linha
+    digitável válida; esgotado o prazo, nenhuma página nova é iniciada
+    
+    Returns:
+        (resultado da página válida ou None, resultado da primeira página ou None)
     """
     
+    def processar_pagina(pagina: int) -> dict:
+        imagem = renderizar_pagina_pdf(pdf_bytes, pagina, dpi, prazo)
+        resultado = processar_imagem(imagem, idioma, prazo, preprocessamento, roi, codigo_barras)
+        resultado.update({'pagina': pagina, 'dpi': dpi})
+        return resultado
+    
+    resultados = {}
+    
+    def registrar(pagina: int, obter) -> bool:
+        """Guarda o resultado da página; True se ela tem a ficha"""
+        try:
+            resultados[pagina] = obter()
+        except Exception as e:
+            logger.warning(f"Erro no OCR da página {pagina} ({dpi} DPI): {str(e)}")
+            return False
+        return tem_linha_digitavel_valida(resultados[pagina]['texto'])
+    
+    # Caso comum (ficha na página 1): nenhuma outra página é renderizada
+    if registrar(1, lambda: processar_pagina(1)):
+        return resultados[1], resultados[1]
+    
+    if total == 1 or prazo.esgotado():
+        return None, resultados.get(1)
+    
+    executor = ThreadPoolExecutor(max_workers=max(1, min(paginas_paralelas, total - 1)))
+    proximas = iter(range(2, total + 1))
+    pendentes = {}
+    
+    def submeter_proxima():
+        # Submete sob demanda: nenhuma página além das em execução fica na fila
+        pagina = None if prazo.esgotado() else next(proximas, None)
+        if pagina is not None:
+            pendentes[executor.submit(processar_pagina, pagina)] = pagina
+    
     try:
-        imagem_bytes = base64.b64decode(base64_string)
-        return extrair_texto_tesseract(imagem_bytes, idioma)
+        for _ in range(max(1, paginas_paralelas)):
+            submeter_proxima()
         
-    except Exception as e:
-        logger.error(f"❌ Erro ao processar base64: {str(e)}")
-        raise Exception(f"Erro ao processar base64: {str(e)}")
\ No newline at end of file
+        while pendentes:
+            concluidos, _ = wait(pendentes, return_when=FIRST_COMPLETED)
+            
+            for future in concluidos:
+                pagina = pendentes.pop(future)
+                if registrar(pagina, future.result):
+                    return resultados[pagina], resultados.get(1)
+                
+                submeter_proxima()
+    finally:
+        # Espera as páginas em andamento: o processo só volta ao pool (e
+        # recebe outro job) sem tesseract/poppler desta busca rodando
+        executor.shutdown(wait=True, cancel_futures=True)
+    
+    return None, resultados.get(1)
+
+
+def processar_imagem(
+    imagem: Image.Image,
+    idioma: str = 'por',
+    prazo: Prazo = SEM_PRAZO,
+    preprocessamento: dict = None,
+    roi: bool = True,
+    codigo_barras: bool = True
+) -> dict:
+    """
+    Lê a linha digitável do código de barras ou, se não der, do recorte da
+    faixa da linha; os demais campos (CNPJ, beneficiário) vêm do OCR só da
+    ficha de compensação quando o recorte valida, senão da página inteira
+    
+    Returns:
+        {'texto': str, 'metodo': 'codigo_barras' | 'roi_linha' | 'pagina_inteira'}
+    """
+    
+    # Código de barras legível dispensa o OCR da linha digitável
+    linha_lida = None
+    metodo = 'pagina_inteira'
+    if codigo_barras:
+        codigo = ler_codigo_barras(imagem)
+        if codigo:
+            linha_lida = f"{linha_digitavel_de_codigo_barras(codigo)}\n{codigo}"
+            metodo = 'codigo_barras'
+            logger.info("✅ Linha digitável obtida do código de barras")
+    
+    # Pré-processamento (cinza, DPI alvo, binarização, deskew)
+    imagem = preprocessar_imagem(imagem, preprocessamento)
+    
+    regiao = imagem
+    if roi and not linha_lida:
+        linha_lida, faixa = extrair_linha_digitavel_roi(imagem, prazo)
+        if linha_lida:
+            metodo = 'roi_linha'
+            x, y, w, h = caixa_ficha_compensacao(faixa, imagem.width, imagem.height)
+            regiao = imagem.crop((x, y, x + w, y + h))
+            logger.info("✅ Linha digitável obtida do recorte, OCR só da ficha de compensação")
+    
+    texto = extrair_texto_pagina(regiao, idioma, prazo)
+    
+    # Linha já lida primeiro: o parser usa a primeira linha digitável do texto
+    if linha_lida:
+        texto = f"{linha_lida}\n{texto}"
+    
+    return {'texto': texto, 'metodo': metodo}
+
+
+def extrair_texto_pagina(imagem: Image.Image, idioma: str = 'por', prazo: Prazo = SEM_PRAZO) -> str:
+    """
+    OCR da página inteira ou de uma região dela (imagem já pré-processada)
+    """
+    
+    # Configuração do Tesseract
+    config = '--psm 6 --oem 3'
+    
+    # Extrair texto
+    texto = pytesseract.image_to_string(
+        imagem,
+        lang=idioma,
+        config=config,
+        timeout=prazo.restante()
+    )
+    
+    logger.info(f"✅ OCR concluído. {len(texto)} caracteres extraídos")
+    
+    return texto.strip()
+
+
+def extrair_linha_digitavel_roi(imagem: Image.Image, prazo: Prazo = SEM_PRAZO) -> tuple:
+    """
+    OCR só dígitos nas faixas candidatas à linha digitável
+    
+    Returns:
+        (linha digitável formatada, faixa (x, y, largura, altura)) da primeira
+        faixa que passar na validação; senão (None, None)
+    """
+    
+    for x, y, w, h in localizar_faixas_linha_digitavel(imagem):
+        recorte = imagem.crop((x, y, x + w, y + h))
+        
+        texto = pytesseract.image_to_string(
+            recorte,
+            config=CONFIG_LINHA_DIGITAVEL,
+            timeout=prazo.restante()
+        )
+        
+        linha = extrair_linha_digitavel(texto)
+        if linha and validar_linha_digitavel(linha)['valido']:
+            return linha, (x, y, w, h)
+    
+    logger.info("Recorte não rendeu linha digitável válida, OCR da página inteira")
+    return None, None
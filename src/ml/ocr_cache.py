@@ -0,0 +1,95 @@
+"""
+Cache de resultados de OCR endereçado por conteúdo
+Camada em memória (LRU por processo) + camada Redis (com TTL, compartilhada)
+"""
+
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+PREFIXO_CHAVE = 'boletos:ocr:'
+
+
+class OCRCache:
+    """Cache do resultado do OCR, chaveado por SHA-256 do arquivo + configuração do OCR"""
+
+    def __init__(self, tamanho: int = 256, redis_conn=None, ttl: int = 7 * 24 * 3600):
+        self.tamanho = tamanho
+        self.redis_conn = redis_conn
+        self.ttl = ttl
+        self._memoria = OrderedDict()
+        self._lock = threading.Lock()
+        self._contadores = {'hits_memoria': 0, 'hits_redis': 0, 'misses': 0}
+
+    @staticmethod
+    def chave(arquivo_bytes: bytes, idioma: str, opcoes: dict) -> str:
+        """Monta a chave: hash do arquivo + hash da configuração do OCR"""
+        hash_arquivo = hashlib.sha256(arquivo_bytes).hexdigest()
+        config = json.dumps({'idioma': idioma, 'opcoes': opcoes}, sort_keys=True)
+        hash_config = hashlib.sha256(config.encode('utf-8')).hexdigest()[:16]
+        return f"{PREFIXO_CHAVE}{hash_arquivo}:{hash_config}"
+
+    def obter(self, chave: str):
+        """Retorna o resultado em cache (memória, depois Redis) ou None"""
+        with self._lock:
+            if chave in self._memoria:
+                self._memoria.move_to_end(chave)
+                self._contadores['hits_memoria'] += 1
+                return self._memoria[chave]
+
+        resultado = self._obter_redis(chave)
+
+        with self._lock:
+            if resultado is None:
+                self._contadores['misses'] += 1
+                return None
+            self._contadores['hits_redis'] += 1
+
+        self._salvar_memoria(chave, resultado)
+        return resultado
+
+    def salvar(self, chave: str, resultado: dict):
+        """Grava o resultado nas duas camadas"""
+        self._salvar_memoria(chave, resultado)
+
+        if self.redis_conn is not None:
+            try:
+                self.redis_conn.set(chave, json.dumps(resultado), ex=self.ttl)
+            except Exception as e:
+                logger.warning(f"Cache OCR: erro ao gravar no Redis: {str(e)}")
+
+    def estatisticas(self) -> dict:
+        """Contadores de hit/miss e taxa de acerto"""
+        with self._lock:
+            stats = dict(self._contadores)
+            stats['itens_memoria'] = len(self._memoria)
+
+        total = stats['hits_memoria'] + stats['hits_redis'] + stats['misses']
+        stats['taxa_acerto'] = (stats['hits_memoria'] + stats['hits_redis']) / total if total else 0.0
+        return stats
+
+    def _obter_redis(self, chave: str):
+        if self.redis_conn is None:
+            return None
+
+        try:
+            valor = self.redis_conn.get(chave)
+        except Exception as e:
+            logger.warning(f"Cache OCR: erro ao ler do Redis: {str(e)}")
+            return None
+
+        return json.loads(valor) if valor is not None else None
+
+    def _salvar_memoria(self, chave: str, resultado: dict):
+        if self.tamanho <= 0:
+            return
+
+        with self._lock:
+            self._memoria[chave] = resultado
+            self._memoria.move_to_end(chave)
+            while len(self._memoria) > self.tamanho:
+                self._memoria.popitem(last=False)
@@ -0,0 +1,334 @@
+"""
+Pool de processos para OCR
+Executa o Tesseract fora da thread chamadora (worker ou event loop da API)
+com timeout rígido por job
+"""
+
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+from collections import deque
+from concurrent.futures import Future, wait
+
+from ml.ocr import extrair_texto_detalhado, OCRTimeoutError
+from ml.ocr_cache import OCRCache
+
+logger = logging.getLogger(__name__)
+
+# Folga (segundos) além do prazo do job: o processo devolve o que tiver
+# (1ª página do PDF) até o prazo; passada a folga, é morto
+MARGEM_TIMEOUT = 5
+
+# Nos processos do pool: avisa o pai de qual processo pegou cada job
+_fila_inicios = None
+
+
+def _iniciar_processo(fila_inicios):
+    global _fila_inicios
+    _fila_inicios = fila_inicios
+    # Grupo de processos próprio: matar o job leva junto tesseract/poppler
+    if hasattr(os, 'setpgid'):
+        os.setpgid(0, 0)
+
+
+def _executar_job(job_id: int, funcao, args, kwargs):
+    """Roda no processo do pool: registra o pid antes de começar"""
+    _fila_inicios.put((job_id, os.getpid()))
+    return funcao(*args, **kwargs)
+
+
+def _matar_grupo(pid: int):
+    """Mata o processo do pool e os tesseract/poppler que ele abriu"""
+    try:
+        if hasattr(os, 'killpg'):
+            os.killpg(pid, signal.SIGKILL)
+        else:
+            os.kill(pid, signal.SIGTERM)
+    except OSError:
+        # Já tinha terminado
+        pass
+
+
+class _Vagas:
+    """
+    Vagas do pool (uma por processo): o job só é submetido com processo livre
+    Não fica presa a um event loop (a vaga é entregue no loop de quem espera)
+    """
+
+    def __init__(self, total: int):
+        self._lock = threading.Lock()
+        self._livres = total
+        self._espera = deque()  # asyncio.Future de quem espera
+
+    async def adquirir(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._livres:
+                self._livres -= 1
+                return
+            futuro = loop.create_future()
+            self._espera.append(futuro)
+
+        try:
+            await futuro
+        except asyncio.CancelledError:
+            with self._lock:
+                if futuro in self._espera:
+                    self._espera.remove(futuro)
+                    raise
+            # A vaga já tinha sido entregue: repassa adiante
+            self.liberar()
+            raise
+
+    def liberar(self):
+        with self._lock:
+            if not self._espera:
+                self._livres += 1
+                return
+            espera = self._espera.popleft()
+
+        espera.get_loop().call_soon_threadsafe(self._entregar, espera)
+
+    @staticmethod
+    def _entregar(futuro):
+        # Cancelado depois de sair da fila de espera: adquirir repassa a vaga
+        if not futuro.done():
+            futuro.set_result(None)
+
+
+class OCRPool:
+    """
+    Pool de processos dedicado ao OCR
+    Um job só entra no pool com processo livre (o timeout não conta a espera)
+    e, se travar, só o processo dele (com os filhos) é morto; o pool repõe o processo
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 0,
+        timeout: int = 60,
+        opcoes: dict = None,
+        cache: OCRCache = None
+    ):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.timeout = timeout
+        # Argumentos extras repassados a extrair_texto_tesseract
+        self.opcoes = opcoes or {}
+        self.cache = cache
+        self._lock = threading.Lock()
+        self._pool = None
+        self._fila_inicios = None
+        self._vagas = _Vagas(self.max_workers)
+        self._ids = itertools.count()
+        self._pids = {}  # job -> pid do processo que o executa
+        self._futures = {}  # job -> Future, até terminar ou ser morto
+
+    def _get_pool(self):
+        """Cria o pool sob demanda"""
+        with self._lock:
+            if self._pool is None:
+                # spawn: o worker tem várias threads, fork não é seguro
+                contexto = multiprocessing.get_context('spawn')
+                self._fila_inicios = contexto.SimpleQueue()
+                self._pool = contexto.Pool(
+                    processes=self.max_workers,
+                    initializer=_iniciar_processo,
+                    initargs=(self._fila_inicios,)
+                )
+                logger.info(f"Pool de OCR iniciado com {self.max_workers} processos")
+            return self._pool
+
+    def submit(self, funcao, *args, **kwargs):
+        """
+        Submete uma função ao pool (chamador já com vaga)
+
+        Returns:
+            (id do job, concurrent.futures.Future)
+        """
+        pool = self._get_pool()
+        job_id = next(self._ids)
+        future = Future()
+
+        def concluir(resultado):
+            self._esquecer(job_id)
+            if future.set_running_or_notify_cancel():
+                future.set_result(resultado)
+
+        def falhar(erro):
+            self._esquecer(job_id)
+            if future.set_running_or_notify_cancel():
+                future.set_exception(erro)
+
+        with self._lock:
+            self._futures[job_id] = future
+        pool.apply_async(_executar_job, (job_id, funcao, args, kwargs), callback=concluir, error_callback=falhar)
+        return job_id, future
+
+    def _submeter_ocr(self, imagem_bytes: bytes, idioma: str):
+        """Submete o job de OCR com as opções do pool"""
+        return self.submit(
+            extrair_texto_detalhado, imagem_bytes, idioma, timeout=self.timeout, **self.opcoes
+        )
+
+    def _atualizar_pids(self):
+        """Lê os avisos de início de job enviados pelos processos"""
+        with self._lock:
+            fila = self._fila_inicios
+            while fila is not None and not fila.empty():
+                job_id, pid = fila.get()
+                self._pids[job_id] = pid
+
+    def _esquecer(self, job_id: int):
+        self._atualizar_pids()
+        with self._lock:
+            self._pids.pop(job_id, None)
+            self._futures.pop(job_id, None)
+
+    def _matar(self, job_id: int):
+        """Mata só o processo com o job travado (o pool cria outro no lugar)"""
+        self._atualizar_pids()
+        with self._lock:
+            pid = self._pids.pop(job_id, None)
+            self._futures.pop(job_id, None)
+
+        if pid is not None:
+            logger.warning(f"⚠️ OCR travado: matando o processo {pid}")
+            _matar_grupo(pid)
+
+    async def extrair_texto_async(self, imagem_bytes: bytes, idioma: str = 'por') -> str:
+        """
+        Executa OCR no pool e retorna só o texto
+        """
+        return (await self.extrair_async(imagem_bytes, idioma))['texto']
+
+    async def extrair_async(self, imagem_bytes: bytes, idioma: str = 'por') -> dict:
+        """
+        Executa OCR no pool sem bloquear o event loop e retorna o resultado
+        detalhado (ver ml.ocr.extrair_texto_detalhado)
+        """
+        chave = self._chave_cache(imagem_bytes, idioma)
+        if chave:
+            # Leitura do Redis é bloqueante: fora do event loop
+            resultado = await asyncio.to_thread(self.cache.obter, chave)
+            if resultado is not None:
+                logger.info("✅ OCR obtido do cache")
+                return {**resultado, 'cache': True}
+
+        # Espera por processo livre fora do timeout
+        await self._vagas.adquirir()
+        try:
+            job_id, future = self._submeter_ocr(imagem_bytes, idioma)
+            try:
+                resultado = await asyncio.wait_for(
+                    asyncio.wrap_future(future),
+                    timeout=self.timeout + MARGEM_TIMEOUT
+                )
+            except asyncio.TimeoutError:
+                self._matar(job_id)
+                raise OCRTimeoutError(f"OCR excedeu {self.timeout}s")
+            except asyncio.CancelledError:
+                # Job abandonado (encerramento do worker): libera o processo de verdade
+                self._matar(job_id)
+                raise
+        finally:
+            self._vagas.liberar()
+
+        if chave:
+            await asyncio.to_thread(self.cache.salvar, chave, resultado)
+        return resultado
+
+    def _chave_cache(self, imagem_bytes: bytes, idioma: str):
+        """Chave do cache para o arquivo (None se o cache estiver desligado)"""
+        if self.cache is None:
+            return None
+        return self.cache.chave(imagem_bytes, idioma, self.opcoes)
+
+    def shutdown(self, esperar: bool = True):
+        """Encerra o pool (sem esperar: mata os processos com OCR em andamento)"""
+        self._atualizar_pids()
+        with self._lock:
+            pool, self._pool = self._pool, None
+            pids = list(self._pids.values())
+            futures = list(self._futures.values())
+
+        if pool is None:
+            return
+
+        if esperar:
+            # Espera só os jobs vivos: um job morto por timeout nunca sai do
+            # pool, e close() + join() ficaria esperando por ele
+            pool.close()
+            wait(futures)
+        else:
+            # terminate só encerra os processos do pool, não os filhos deles
+            for pid in pids:
+                _matar_grupo(pid)
+        pool.terminate()
+        pool.join()
+
+
+# Instância global (criada sob demanda)
+_ocr_pool = None
+
+
+def get_ocr_pool() -> OCRPool:
+    """Retorna o pool de OCR configurado em settings"""
+    global _ocr_pool
+
+    if _ocr_pool is None:
+        from config import settings
+
+        cache = None
+        if settings.ocr_cache:
+            redis_conn = None
+            if settings.ocr_cache_redis:
+                from redis import Redis
+                redis_conn = Redis.from_url(settings.redis_url)
+            cache = OCRCache(
+                tamanho=settings.ocr_cache_tamanho,
+                redis_conn=redis_conn,
+                ttl=settings.ocr_cache_ttl
+            )
+
+        _ocr_pool = OCRPool(
+            max_workers=settings.ocr_workers,
+            timeout=settings.ocr_timeout,
+            opcoes={
+                'preprocessamento': {
+                    'grayscale': settings.ocr_grayscale,
+                    'redimensionar': settings.ocr_redimensionar,
+                    'dpi_alvo': settings.ocr_dpi_alvo,
+                    'binarizar': settings.ocr_binarizar,
+                    'deskew': settings.ocr_deskew
+                },
+                'roi': settings.ocr_roi_linha,
+                'texto_pdf': settings.ocr_texto_pdf,
+                'codigo_barras': settings.ocr_codigo_barras,
+                'max_paginas': settings.ocr_max_paginas,
+                'paginas_paralelas': settings.ocr_paginas_paralelas,
+                'dpis_pdf': list(settings.ocr_dpis_pdf)
+            },
+            cache=cache
+        )
+
+    return _ocr_pool
+
+
+def fechar_ocr_pool(esperar: bool = True):
+    """Encerra o pool global, se existir"""
+    global _ocr_pool
+
+    if _ocr_pool is not None:
+        _ocr_pool.shutdown(esperar)
+        _ocr_pool = None
+
+
+def estatisticas_cache_ocr():
+    """Contadores do cache de OCR do pool global (None sem pool ou sem cache)"""
+    if _ocr_pool is None or _ocr_pool.cache is None:
+        return None
+    return _ocr_pool.cache.estatisticas()
@@ -3,11 +3,19 @@ Parser - Extrai campos estruturados de boletos
 """
 
 import re
-from datetime import datetime
+from datetime import datetime, timedelta
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Padrão da linha digitável formatada
+# 5 dígitos . 5 dígitos espaço 5 dígitos . 6 dígitos espaço 5 dígitos . 6 dígitos espaço 1 dígito espaço 14 dígitos
+PADRAO_LINHA_DIGITAVEL = r'(\d{5})[.\s]?(\d{5})\s?(\d{5})[.\s]?(\d{6})\s?(\d{5})[.\s]?(\d{6})\s?(\d)\s?(\d{14})'
+
+# Datas base do fator de vencimento (o fator reinicia em 1000 em 22/02/2025)
+DATA_BASE_FATOR = datetime(1997, 10, 7)
+DATA_BASE_FATOR_NOVA = datetime(2025, 2, 22)
+
 
 def parse_dados_boleto(texto_ocr: str) -> dict:
     """
@@ -44,6 +52,9 @@ def parse_dados_boleto(texto_ocr: str) -> dict:
             # Extrair código do banco da linha digitável (3 primeiros dígitos)
             dados['codigo_banco'] = linha_digitavel[:3]
         
+        # Campos seguintes não devem casar com os dígitos da linha/código de barras
+        texto_sem_codigos = remover_codigos_boleto(texto_ocr)
+        
         # 2. EXTRAIR CÓDIGO DE BARRAS (44 dígitos sem formatação)
         codigo_barras = extrair_codigo_barras(texto_ocr)
         if codigo_barras:
@@ -51,19 +62,23 @@ def parse_dados_boleto(texto_ocr: str) -> dict:
             logger.info(f"✅ Código de barras: {codigo_barras}")
         
         # 3. EXTRAIR VALOR
-        valor = extrair_valor(texto_ocr)
+        valor = extrair_valor(texto_sem_codigos)
+        if not valor and linha_digitavel:
+            valor = extrair_valor_linha_digitavel(linha_digitavel)
         if valor:
             dados['valor'] = valor
             logger.info(f"✅ Valor: R$ {valor}")
         
         # 4. EXTRAIR VENCIMENTO
-        vencimento = extrair_vencimento(texto_ocr)
+        vencimento = extrair_vencimento(texto_sem_codigos)
+        if not vencimento and linha_digitavel:
+            vencimento = extrair_vencimento_linha_digitavel(linha_digitavel)
         if vencimento:
             dados['vencimento'] = vencimento
             logger.info(f"✅ Vencimento: {vencimento}")
         
         # 5. EXTRAIR CNPJ
-        cnpj = extrair_cnpj(texto_ocr)
+        cnpj = extrair_cnpj(texto_sem_codigos)
         if cnpj:
             dados['beneficiario_cnpj'] = cnpj
             logger.info(f"✅ CNPJ: {cnpj}")
@@ -91,10 +106,7 @@ def extrair_linha_digitavel(texto: str) -> str:
     # Remover quebras de linha
     texto = texto.replace('\n', ' ')
     
-    # Padrão: 5 dígitos . 5 dígitos espaço 5 dígitos . 6 dígitos espaço 5 dígitos . 6 dígitos espaço 1 dígito espaço 14 dígitos
-    padrao = r'(\d{5})[.\s]?(\d{5})\s?(\d{5})[.\s]?(\d{6})\s?(\d{5})[.\s]?(\d{6})\s?(\d)\s?(\d{14})'
-    
-    match = re.search(padrao, texto)
+    match = re.search(PADRAO_LINHA_DIGITAVEL, texto)
     if match:
         # Reconstruir linha digitável formatada
         grupos = match.groups()
@@ -112,6 +124,55 @@ def extrair_linha_digitavel(texto: str) -> str:
     return None
 
 
+def remover_codigos_boleto(texto: str) -> str:
+    """
+    Remove a linha digitável (formatada ou 47 dígitos seguidos) e o
+    código de barras (44 dígitos) do texto
+    """
+    
+    texto = texto.replace('\n', ' \n ')
+    texto = re.sub(PADRAO_LINHA_DIGITAVEL, ' ', texto)
+    texto = re.sub(r'\b\d{47}\b', ' ', texto)
+    texto = re.sub(r'\b\d{44}\b', ' ', texto)
+    return texto.replace(' \n ', '\n')
+
+
+def extrair_valor_linha_digitavel(linha: str) -> float:
+    """
+    Extrai valor codificado na linha digitável (últimos 10 dígitos, em centavos)
+    """
+    
+    digitos = re.sub(r'[^\d]', '', linha)
+    if len(digitos) != 47:
+        return None
+    
+    valor = int(digitos[37:47]) / 100
+    return valor if valor > 0 else None
+
+
+def extrair_vencimento_linha_digitavel(linha: str) -> str:
+    """
+    Extrai vencimento a partir do fator de vencimento (dígitos 34 a 37)
+    Entre os dois ciclos do fator, escolhe a data mais próxima de hoje
+    """
+    
+    digitos = re.sub(r'[^\d]', '', linha)
+    if len(digitos) != 47:
+        return None
+    
+    fator = int(digitos[33:37])
+    if fator == 0:
+        return None
+    
+    candidatas = [DATA_BASE_FATOR + timedelta(days=fator)]
+    if fator >= 1000:
+        candidatas.append(DATA_BASE_FATOR_NOVA + timedelta(days=fator - 1000))
+    
+    hoje = datetime.now()
+    vencimento = min(candidatas, key=lambda data: abs((data - hoje).days))
+    return vencimento.strftime('%d/%m/%Y')
+
+
 def extrair_codigo_barras(texto: str) -> str:
     """
     Extrai código de barras (44 dígitos)
@@ -0,0 +1,177 @@
+"""
+Pré-processamento de imagens antes do OCR (OpenCV)
+Escala de cinza, redução para DPI alvo, binarização adaptativa e correção de inclinação
+"""
+
+import logging
+import cv2
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Largura de uma página A4 em polegadas (usada para estimar o DPI de fotos)
+LARGURA_PAGINA_POL = 8.27
+
+# Ângulo máximo (graus) corrigido pelo deskew
+ANGULO_MAXIMO_DESKEW = 15.0
+
+OPCOES_PADRAO = {
+    'grayscale': True,
+    'redimensionar': True,
+    'dpi_alvo': 300,
+    'binarizar': True,
+    'deskew': True
+}
+
+
+def preprocessar_imagem(imagem: Image.Image, opcoes: dict = None) -> Image.Image:
+    """
+    Aplica o pipeline de pré-processamento na imagem
+
+    Args:
+        imagem: Imagem PIL original
+        opcoes: Etapas habilitadas (ver OPCOES_PADRAO)
+
+    Returns:
+        Imagem PIL pronta para o Tesseract
+    """
+
+    opcoes = {**OPCOES_PADRAO, **(opcoes or {})}
+
+    # Binarização e deskew trabalham em escala de cinza
+    if not (opcoes['grayscale'] or opcoes['binarizar'] or opcoes['deskew']):
+        if opcoes['redimensionar']:
+            return _redimensionar_pil(imagem, opcoes['dpi_alvo'])
+        return imagem
+
+    matriz = converter_escala_cinza(imagem)
+
+    if opcoes['redimensionar']:
+        matriz = reduzir_para_dpi(matriz, opcoes['dpi_alvo'])
+
+    if opcoes['binarizar']:
+        matriz = binarizar_adaptativo(matriz)
+
+    if opcoes['deskew']:
+        matriz = corrigir_inclinacao(matriz)
+
+    logger.info(f"Pré-processamento concluído: {matriz.shape[1]}x{matriz.shape[0]}")
+
+    return Image.fromarray(matriz)
+
+
+def converter_escala_cinza(imagem: Image.Image) -> np.ndarray:
+    """
+    Converte imagem PIL para matriz em escala de cinza (uint8)
+    """
+
+    if imagem.mode == 'L':
+        return np.array(imagem)
+
+    rgb = np.array(imagem.convert('RGB'))
+    return cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
+
+
+def calcular_escala(largura: int, dpi_alvo: int) -> float:
+    """
+    Fator de redução para que a largura da página corresponda ao DPI alvo
+    Nunca amplia a imagem (retorna no máximo 1.0)
+    """
+
+    largura_maxima = dpi_alvo * LARGURA_PAGINA_POL
+    if largura <= largura_maxima:
+        return 1.0
+    return largura_maxima / largura
+
+
+def reduzir_para_dpi(matriz: np.ndarray, dpi_alvo: int) -> np.ndarray:
+    """
+    Reduz a matriz para o DPI alvo (INTER_AREA preserva traços finos)
+    """
+
+    escala = calcular_escala(matriz.shape[1], dpi_alvo)
+    if escala >= 1.0:
+        return matriz
+
+    return cv2.resize(matriz, None, fx=escala, fy=escala, interpolation=cv2.INTER_AREA)
+
+
+def _redimensionar_pil(imagem: Image.Image, dpi_alvo: int) -> Image.Image:
+    """
+    Reduz imagem PIL colorida para o DPI alvo
+    """
+
+    escala = calcular_escala(imagem.width, dpi_alvo)
+    if escala >= 1.0:
+        return imagem
+
+    tamanho = (max(1, int(imagem.width * escala)), max(1, int(imagem.height * escala)))
+    return imagem.resize(tamanho, Image.LANCZOS)
+
+
+def binarizar_adaptativo(matriz: np.ndarray) -> np.ndarray:
+    """
+    Binarização adaptativa (resistente a sombras e iluminação irregular de fotos)
+    """
+
+    # Tamanho do bloco proporcional à imagem (sempre ímpar)
+    bloco = max(15, (min(matriz.shape[:2]) // 50) | 1)
+
+    return cv2.adaptiveThreshold(
+        matriz,
+        255,
+        cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+        cv2.THRESH_BINARY,
+        bloco,
+        15
+    )
+
+
+def estimar_inclinacao(matriz: np.ndarray) -> float:
+    """
+    Estima o ângulo de inclinação do texto (graus) pelo retângulo mínimo
+    que envolve os pixels escuros
+    """
+
+    _, tinta = cv2.threshold(matriz, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    pontos = cv2.findNonZero(tinta)
+
+    if pontos is None or len(pontos) < 100:
+        return 0.0
+
+    angulo = cv2.minAreaRect(pontos)[-1]
+
+    # Normalizar para [-45, 45)
+    if angulo >= 45:
+        angulo -= 90
+    elif angulo < -45:
+        angulo += 90
+
+    return float(angulo)
+
+
+def corrigir_inclinacao(matriz: np.ndarray) -> np.ndarray:
+    """
+    Rotaciona a matriz para alinhar as linhas de texto na horizontal
+    """
+
+    angulo = estimar_inclinacao(matriz)
+
+    if abs(angulo) < 0.3 or abs(angulo) > ANGULO_MAXIMO_DESKEW:
+        return matriz
+
+    altura, largura = matriz.shape[:2]
+    centro = (largura / 2, altura / 2)
+    rotacao = cv2.getRotationMatrix2D(centro, angulo, 1.0)
+
+    logger.info(f"Corrigindo inclinação: {angulo:.2f}°")
+
+    return cv2.warpAffine(
+        matriz,
+        rotacao,
+        (largura, altura),
+        flags=cv2.INTER_CUBIC,
+        borderMode=cv2.BORDER_CONSTANT,
+        borderValue=255
+    )
@@ -0,0 +1,267 @@
+"""
+Supervisor prefork: vários processos de worker na mesma máquina
+Carrega o modelo antes do fork (memória compartilhada copy-on-write) e
+recria os processos que morrem ou passam do limite de memória
+
+Uso: python src/worker/supervisor.py (Linux/macOS; no Windows roda um worker só)
+"""
+
+import sys
+import os
+import gc
+import time
+import signal
+import logging
+
+# Adicionar src ao path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import settings
+import worker
+
+logger = logging.getLogger(__name__)
+
+# Verificação de processos mortos / memória (segundos)
+INTERVALO_VERIFICACAO = 2
+
+# Processo que morre antes disso é considerado instável: espera para recriar
+VIDA_MINIMA = 10
+ATRASO_MAXIMO_REINICIO = 30
+
+# Folga além do prazo de drenagem antes de matar um processo no encerramento
+MARGEM_ENCERRAMENTO = 5
+
+
+def memoria_processo(pid: int) -> int:
+    """
+    Memória própria (bytes) do processo, sem as páginas ainda compartilhadas
+    com o supervisor; cai para a memória residente sem smaps_rollup e
+    retorna 0 sem /proc
+    """
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            return sum(
+                int(linha.split()[1]) * 1024
+                for linha in f
+                if linha.startswith(('Private_Clean:', 'Private_Dirty:'))
+            )
+    except (OSError, ValueError, IndexError):
+        pass
+
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            paginas = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return 0
+    return paginas * os.sysconf('SC_PAGE_SIZE')
+
+
+def preparar_processo_pai():
+    """
+    Carrega o que todos os workers usam antes do fork, para as páginas serem
+    compartilhadas entre os processos
+    """
+    from ml.model import carregar_modelo, versao_modelo
+    import ml.parser  # noqa: F401
+    import ml.validator  # noqa: F401
+    import ml.explainer  # noqa: F401
+
+    try:
+        carregar_modelo()
+        versao_modelo(settings.model_path)
+    except Exception as e:
+        # Cada worker tenta de novo ao processar (e registra a falha do job)
+        logger.warning(f"[SUPERVISOR] Modelo não carregado antes do fork: {str(e)}")
+
+    # Objetos já criados ficam fora do GC: a coleta não toca (e não copia) essas páginas
+    gc.freeze()
+
+
+class Supervisor:
+    """Cria e acompanha os processos de worker"""
+
+    def __init__(self, processos: int = None, memoria_maxima_mb: int = None):
+        cpus = os.cpu_count() or 1
+        self.processos = max(1, processos or settings.worker_processos or cpus)
+
+        memoria_maxima_mb = settings.worker_memoria_maxima_mb if memoria_maxima_mb is None else memoria_maxima_mb
+        self.memoria_maxima = memoria_maxima_mb * 1024 * 1024
+
+        # Pool de OCR de cada worker: divide as CPUs entre os processos
+        if settings.ocr_workers == 0:
+            settings.ocr_workers = max(1, cpus // self.processos)
+
+        self.filhos = {}  # pid -> (slot, início)
+        self.falhas = {}  # slot -> mortes seguidas antes de VIDA_MINIMA
+        self.reciclando = {}  # pid -> prazo para sair (acima do limite de memória)
+        self.running = True
+
+    def iniciar_filho(self, slot: int) -> int:
+        """Faz o fork de um worker"""
+        pid = os.fork()
+
+        if pid == 0:
+            # Processo filho: grupo próprio (Ctrl+C chega só ao supervisor, que repassa)
+            os.setpgid(0, 0)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            codigo = 0
+            if settings.worker_metricas_porta:
+                # Uma porta de métricas por processo
+                settings.worker_metricas_porta += slot
+            try:
+                worker.main()
+            except Exception as e:
+                logger.error(f"[SUPERVISOR] Worker {slot} terminou com erro: {str(e)}")
+                codigo = 1
+            finally:
+                logging.shutdown()
+                os._exit(codigo)
+
+        self.filhos[pid] = (slot, time.monotonic())
+        logger.info(f"[SUPERVISOR] Worker {slot} iniciado (pid {pid})")
+        return pid
+
+    def encerrar(self, numero, _frame=None):
+        """SIGTERM/SIGINT: repassa SIGTERM aos workers (cada um drena seus jobs)"""
+        if not self.running:
+            return
+
+        logger.info(f"[SUPERVISOR] {signal.Signals(numero).name} recebido: encerrando {len(self.filhos)} worker(s)")
+        self.running = False
+        self._sinalizar(signal.SIGTERM)
+
+    def run(self):
+        """Loop principal: recria workers que morrem ou passam do limite de memória"""
+        logger.info(f"[SUPERVISOR] Iniciando {self.processos} worker(s)")
+        if self.memoria_maxima:
+            logger.info(f"[SUPERVISOR] Limite de memória por worker: {self.memoria_maxima // (1024 * 1024)} MB")
+
+        preparar_processo_pai()
+
+        signal.signal(signal.SIGTERM, self.encerrar)
+        signal.signal(signal.SIGINT, self.encerrar)
+
+        for slot in range(self.processos):
+            self.iniciar_filho(slot)
+
+        reinicios = {}  # slot -> horário para recriar
+
+        while self.running:
+            time.sleep(INTERVALO_VERIFICACAO)
+
+            for slot in self._recolher_mortos():
+                if not self.running:
+                    break
+                atraso = self._atraso_reinicio(slot)
+                if atraso:
+                    logger.warning(f"[SUPERVISOR] Worker {slot} instável: recriando em {atraso}s")
+                reinicios[slot] = time.monotonic() + atraso
+
+            for slot, horario in list(reinicios.items()):
+                if self.running and time.monotonic() >= horario:
+                    del reinicios[slot]
+                    self.iniciar_filho(slot)
+
+            self._verificar_memoria()
+
+        self._aguardar_filhos()
+        logger.info("[SUPERVISOR] 👋 Encerrado")
+
+    def _recolher_mortos(self) -> list:
+        """Slots dos workers que terminaram desde a última verificação"""
+        mortos = []
+        while self.filhos:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+
+            slot, inicio = self.filhos.pop(pid, (None, None))
+            if slot is None:
+                continue
+
+            # Reciclado por memória não conta como falha
+            vida = time.monotonic() - inicio
+            if self.reciclando.pop(pid, None) is not None or vida >= VIDA_MINIMA:
+                self.falhas[slot] = 0
+            else:
+                self.falhas[slot] = self.falhas.get(slot, 0) + 1
+            logger.warning(
+                f"[SUPERVISOR] Worker {slot} (pid {pid}) terminou "
+                f"(código {os.waitstatus_to_exitcode(status)}) após {vida:.0f}s"
+            )
+            mortos.append(slot)
+        return mortos
+
+    def _atraso_reinicio(self, slot: int) -> int:
+        """Backoff para worker que morre logo ao iniciar (ex.: MongoDB fora do ar)"""
+        falhas = self.falhas.get(slot, 0)
+        if not falhas:
+            return 0
+        return min(ATRASO_MAXIMO_REINICIO, 2 ** (falhas - 1))
+
+    def _verificar_memoria(self):
+        """Pede encerramento (drenando os jobs) ao worker acima do limite"""
+        if not self.memoria_maxima:
+            return
+
+        for pid, (slot, _) in list(self.filhos.items()):
+            if pid in self.reciclando:
+                # Já avisado: mata se não sair no prazo
+                if time.monotonic() > self.reciclando[pid]:
+                    logger.warning(f"[SUPERVISOR] Worker {slot} (pid {pid}) não encerrou no prazo: matando")
+                    self._enviar(pid, signal.SIGKILL)
+                continue
+
+            memoria = memoria_processo(pid)
+            if memoria > self.memoria_maxima:
+                logger.warning(
+                    f"[SUPERVISOR] Worker {slot} (pid {pid}) usa {memoria // (1024 * 1024)} MB: reiniciando"
+                )
+                self._enviar(pid, signal.SIGTERM)
+                self.reciclando[pid] = (
+                    time.monotonic() + settings.worker_prazo_encerramento + MARGEM_ENCERRAMENTO
+                )
+
+    def _aguardar_filhos(self):
+        """Espera os workers drenarem; mata os que passarem do prazo"""
+        limite = time.monotonic() + settings.worker_prazo_encerramento + MARGEM_ENCERRAMENTO
+
+        while self.filhos and time.monotonic() < limite:
+            self._recolher_mortos()
+            time.sleep(0.2)
+
+        if self.filhos:
+            logger.warning(f"[SUPERVISOR] {len(self.filhos)} worker(s) não encerraram no prazo: matando")
+            self._sinalizar(signal.SIGKILL)
+            while self.filhos:
+                pid, _ = os.waitpid(-1, 0)
+                self.filhos.pop(pid, None)
+
+    def _sinalizar(self, sinal):
+        for pid in list(self.filhos):
+            self._enviar(pid, sinal)
+
+    @staticmethod
+    def _enviar(pid: int, sinal):
+        try:
+            os.kill(pid, sinal)
+        except ProcessLookupError:
+            pass
+
+
+def main():
+    """Inicializa o supervisor (ou um worker só, sem fork disponível)"""
+    if not hasattr(os, 'fork'):
+        logger.warning("[SUPERVISOR] fork indisponível (Windows): rodando um worker só")
+        worker.main()
+        return
+
+    Supervisor().run()
+
+
+if __name__ == '__main__':
+    main()
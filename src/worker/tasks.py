@@ -1,25 +1,29 @@
 """
 Tasks - Jobs que serão processados pelo worker
+Rodam no event loop do worker: I/O (MongoDB) é aguardado e as etapas de CPU
+vão para executores (OCR no pool de processos, o resto no pool de threads)
 """
 
 from datetime import datetime
+import asyncio
 import logging
-import base64
 
 # Imports do explainer
 from ml.explainer import gerar_explicacao_humanizada
+from jobs.cronometro import Cronometro
 
 logger = logging.getLogger(__name__)
 
 
-def processar_boleto(analise_id: str, file_base64: str, file_type: str):
+async def processar_boleto(analise_id: str, file_bytes: bytes, file_type: str, cronometro: Cronometro = None):
     """
     Job principal: processa boleto completo
     
     Args:
         analise_id: ID da análise no MongoDB
-        file_base64: Arquivo em base64
+        file_bytes: Bytes do arquivo
         file_type: Tipo do arquivo (image/jpeg, application/pdf)
+        cronometro: Tempos já medidos pelo worker (fila, decodificação)
     
     Returns:
         Resultado da análise
@@ -31,37 +35,47 @@ def processar_boleto(analise_id: str, file_base64: str, file_type: str):
         
         # Imports locais
         from database.mongodb import get_db
-        from ml.ocr import extrair_texto_de_base64
+        from ml.ocr_pool import get_ocr_pool
         from ml.parser import parse_dados_boleto
         from ml.validator import validar_boleto_febraban
-        from ml.model import carregar_modelo, preparar_features, predizer_fraude
+        from ml.model import carregar_modelo, preparar_features, predizer_fraude, versao_modelo
+        from config import settings
+        from pymongo import WriteConcern
+        
+        cronometro = cronometro or Cronometro()
         
         # Atualizar status no MongoDB
         db = get_db()
-        db.analises.update_one(
+        await db.analises.update_one(
             {'_id': analise_id},
             {'$set': {'status': 'processing'}}
         )
         
         # PIPELINE COMPLETO
         
-        # 1. OCR - Extrair texto
+        # 1. OCR - Extrair texto (no pool de processos, com timeout)
         logger.info(f"[JOB] {analise_id} - Etapa 1: OCR")
-        texto = extrair_texto_de_base64(file_base64)
+        with cronometro.etapa('ocr'):
+            resultado_ocr = await get_ocr_pool().extrair_async(file_bytes)
+        texto = resultado_ocr['texto']
         
         # 2. Parser - Extrair dados estruturados
         logger.info(f"[JOB] {analise_id} - Etapa 2: Parser")
-        dados = parse_dados_boleto(texto)
+        with cronometro.etapa('parser'):
+            dados = await asyncio.to_thread(parse_dados_boleto, texto)
         
         # 3. Validação FEBRABAN
         logger.info(f"[JOB] {analise_id} - Etapa 3: Validação FEBRABAN")
-        validacao = validar_boleto_febraban(dados)
+        with cronometro.etapa('validacao'):
+            validacao = await asyncio.to_thread(validar_boleto_febraban, dados)
         
         # 4. Modelo ML
         logger.info(f"[JOB] {analise_id} - Etapa 4: Modelo ML")
-        modelo = carregar_modelo()
-        features = preparar_features(dados)
-        predicao_ml = predizer_fraude(modelo, features)
+        with cronometro.etapa('features'):
+            features = await asyncio.to_thread(preparar_features, dados)
+        with cronometro.etapa('predicao'):
+            modelo = await asyncio.to_thread(carregar_modelo)
+            predicao_ml = await asyncio.to_thread(predizer_fraude, modelo, features)
         
         # 5. Resultado final
         is_fraudulento = (not validacao['valido']) or predicao_ml['is_fraudulento']
@@ -74,39 +88,58 @@ def processar_boleto(analise_id: str, file_base64: str, file_type: str):
         
         # 6. Gerar explicação humanizada
         logger.info(f"[JOB] {analise_id} - Etapa 5: Explicabilidade")
-        explicacao = gerar_explicacao_humanizada(
-            dados_extraidos=dados,
-            resultado_validacao=validacao,
-            predicao_ml=predicao_ml
-        )
+        with cronometro.etapa('explicacao'):
+            explicacao = await asyncio.to_thread(
+                gerar_explicacao_humanizada,
+                dados_extraidos=dados,
+                resultado_validacao=validacao,
+                predicao_ml=predicao_ml
+            )
         
         # Calcular tempo de processamento
         tempo_processamento = (datetime.utcnow() - inicio).total_seconds()
         
         # Salvar resultado no MongoDB
         logger.info(f"[JOB] {analise_id} - Salvando resultado")
-        db.analises.update_one(
+        versao = await asyncio.to_thread(versao_modelo, settings.model_path)
+        with cronometro.etapa('gravacao'):
+            await db.analises.update_one(
+                {'_id': analise_id},
+                {'$set': {
+                    'status': 'completed',
+                    'processedAt': datetime.utcnow(),
+                    'processingTime': tempo_processamento,
+                    'modeloVersao': versao,
+                    'stageTimings': cronometro.documento(),
+                    'ocrDetalhes': {
+                        'metodo': resultado_ocr['metodo'],
+                        'pagina': resultado_ocr.get('pagina'),
+                        'dpi': resultado_ocr.get('dpi'),
+                        'cache': resultado_ocr.get('cache', False)
+                    },
+                    'dadosExtraidos': dados,
+                    'validacaoTecnica': validacao,
+                    'predicaoML': predicao_ml,
+                    'fraudeAnalise': {
+                        'isFraudulento': is_fraudulento,
+                        'score': predicao_ml['score_fraude'],
+                        'confianca': predicao_ml['confianca'],
+                        'metodos': metodos,
+                        'motivos': validacao['erros'] if not validacao['valido'] else [],
+                        'explicacao': explicacao  # Explicabilidade completa!
+                    }
+                }}
+            )
+        
+        # Tempo da própria gravação: complemento sem esperar confirmação do MongoDB
+        await db.analises.with_options(write_concern=WriteConcern(w=0)).update_one(
             {'_id': analise_id},
-            {'$set': {
-                'status': 'completed',
-                'processedAt': datetime.utcnow(),
-                'processingTime': tempo_processamento,
-                'dadosExtraidos': dados,
-                'validacaoTecnica': validacao,
-                'predicaoML': predicao_ml,
-                'fraudeAnalise': {
-                    'isFraudulento': is_fraudulento,
-                    'score': predicao_ml['score_fraude'],
-                    'confianca': predicao_ml['confianca'],
-                    'metodos': metodos,
-                    'motivos': validacao['erros'] if not validacao['valido'] else [],
-                    'explicacao': explicacao  # Explicabilidade completa!
-                }
-            }}
+            {'$set': {'stageTimings.gravacao': cronometro.documento()['gravacao']}}
         )
         
         logger.info(f"[JOB] ✅ {analise_id} - Concluído em {tempo_processamento:.2f}s")
         logger.info(f"[JOB] Resultado: {'FRAUDULENTO' if is_fraudulento else 'VÁLIDO'}")
+        logger.info(f"[JOB] Etapas (ms): {cronometro.documento()}")
         
         return {
             'analise_id': analise_id,
@@ -116,17 +149,53 @@ def processar_boleto(analise_id: str, file_base64: str, file_type: str):
         }
         
     except Exception as e:
+        # O worker decide entre nova tentativa e falha definitiva
         logger.error(f"[JOB] ❌ Erro no processamento {analise_id}: {str(e)}")
-        
-        # Salvar erro no MongoDB
-        db = get_db()
-        db.analises.update_one(
-            {'_id': analise_id},
-            {'$set': {
-                'status': 'failed',
-                'error': str(e),
-                'failedAt': datetime.utcnow()
-            }}
-        )
-        
-        raise
\ No newline at end of file
+        raise
+
+
+async def registrar_nova_tentativa(analise_id: str, erro: str, tentativa: int) -> bool:
+    """
+    Registra que a análise falhou e será tentada novamente (continua em processamento)
+    Análise já concluída (por outra execução do mesmo job) não volta atrás
+    
+    Returns:
+        False se a análise já estava concluída
+    """
+    
+    from database.mongodb import get_db
+    
+    db = get_db()
+    resultado = await db.analises.update_one(
+        {'_id': analise_id, 'status': {'$ne': 'completed'}},
+        {'$set': {
+            'status': 'processing',
+            'tentativas': tentativa,
+            'ultimoErro': erro
+        }}
+    )
+    return resultado.matched_count > 0
+
+
+async def registrar_falha(analise_id: str, erro: str, tentativas: int) -> bool:
+    """
+    Marca a análise como falha definitiva (tentativas esgotadas)
+    Análise já concluída (por outra execução do mesmo job) não volta atrás
+    
+    Returns:
+        False se a análise já estava concluída
+    """
+    
+    from database.mongodb import get_db
+    
+    db = get_db()
+    resultado = await db.analises.update_one(
+        {'_id': analise_id, 'status': {'$ne': 'completed'}},
+        {'$set': {
+            'status': 'failed',
+            'error': erro,
+            'tentativas': tentativas,
+            'failedAt': datetime.utcnow()
+        }}
+    )
+    return resultado.matched_count > 0
\ No newline at end of file
@@ -1,22 +1,31 @@
 """
-Worker simples usando threading (funciona no Windows)
+Worker assíncrono: o event loop cuida da fila (Redis) e do MongoDB, e as
+etapas de CPU rodam em executores (funciona no Windows)
 """
 
 import sys
 import os
-import time
 import logging
-from threading import Thread
-from redis import Redis
-import json
+import asyncio
+import signal
+from concurrent.futures import ThreadPoolExecutor
+from redis.asyncio import Redis
 
 # Adicionar src ao path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from config import settings
-from database.mongodb import connect_mongodb
-from tasks import processar_boleto
-import asyncio
+from database.mongodb import connect_mongodb, close_mongodb
+from tasks import processar_boleto, registrar_nova_tentativa, registrar_falha
+from jobs.envelope import empacotar_job, desempacotar_job
+from jobs.blobs import criar_blob_store, FilesystemBlobStore, BlobNaoEncontrado
+from jobs.fila import FilaJobs, nome_consumidor, tempo_na_fila
+from jobs.cronometro import Cronometro
+from jobs.metricas import Registro, MetricasFila, servir_metricas
+from jobs.eventos import publicar_status
+from jobs.retry import AgendadorRetry
+from ml.ocr import OCRTimeoutError, ArquivoInvalidoError
+from ml.ocr_pool import fechar_ocr_pool
 
 # Logging
 logging.basicConfig(
@@ -25,73 +34,471 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Destinos em que o job sai da fila (XACK); com 'falha' (nem nova tentativa
+# nem DLQ gravadas) ele fica pendente e é reivindicado
+RESULTADOS_CONFIRMADOS = ('concluido', 'retry', 'dlq', 'invalido')
+
+# Falhas que não adianta tentar de novo (OCR travado: o arquivo trava de novo).
+# Envelope com campos faltando nem chega aqui: é confirmado como 'invalido'
+ERROS_DEFINITIVOS = (BlobNaoEncontrado, ArquivoInvalidoError, OCRTimeoutError)
+
+
+class JobAbandonado(Exception):
+    """Job reivindicado: o worker anterior morreu ou travou no meio dele"""
+
+
+class JobInterrompido(Exception):
+    """Job cancelado no encerramento do worker, na última tentativa"""
+
 
 class SimpleWorker:
-    """Worker simples que processa jobs da fila Redis"""
-    
-    def __init__(self):
+    """Worker que processa jobs da fila Redis como tarefas asyncio"""
+
+    def __init__(self, concurrency: int = None):
         self.redis_conn = Redis.from_url(settings.redis_url)
-        self.queue_name = 'boletos:jobs'
+        self.fila = FilaJobs(
+            self.redis_conn,
+            pesos=settings.fila_pesos,
+            max_por_usuario=settings.fila_max_por_usuario
+        )
+        self.consumidor = nome_consumidor()
         self.running = True
-        
-    def processar_job(self, job_data):
-        """Processa um job"""
+        self._parar = asyncio.Event()
+
+        # Ao receber SIGTERM: jobs em andamento têm esse prazo para terminar
+        self.prazo_encerramento = settings.worker_prazo_encerramento
+        self.blob_store = criar_blob_store(settings, self.redis_conn)
+
+        # Reivindicação de jobs pendentes de workers que morreram
+        self.reclaim_ocioso_ms = settings.fila_reclaim_ocioso * 1000
+        self.reclaim_intervalo = settings.fila_reclaim_intervalo
+        self._proximo_reclaim = 0
+
+        # Entradas (stream, entry_id) em andamento: renovadas para não parecerem abandonadas
+        self.em_andamento = set()
+        self.intervalo_renovacao = max(1, settings.fila_reclaim_ocioso / 3)
+
+        # Novas tentativas com backoff e fila de jobs mortos
+        self.retry = AgendadorRetry(
+            self.redis_conn,
+            max_tentativas=settings.retry_max_tentativas,
+            base=settings.retry_atraso_base,
+            maximo=settings.retry_atraso_maximo
+        )
+        self._proximo_retry = 0
+
+        # Jobs em andamento: só retira job da fila quando há vaga livre; mais jobs
+        # que processos de OCR só esperariam aqui, em vez de na fila, disponíveis
+        # para outros workers
+        processos_ocr = settings.ocr_workers or os.cpu_count() or 1
+        self.concurrency = max(1, min(concurrency or settings.worker_concurrency, processos_ocr))
+        self.slots = asyncio.Semaphore(self.concurrency)
+        self.tarefas = set()
+
+        # Métricas Prometheus (servidor próprio na porta worker_metricas_porta)
+        self.registro = Registro()
+        self.metricas_fila = MetricasFila(self.registro)
+        self.metrica_etapas = self.registro.histograma(
+            'boletos_etapa_duracao_segundos', 'Duração de cada etapa do job', ['etapa', 'tipo_arquivo']
+        )
+        self.metrica_em_andamento = self.registro.medidor(
+            'boletos_jobs_em_andamento', 'Jobs em processamento neste worker'
+        )
+        self.metrica_jobs = self.registro.contador(
+            'boletos_jobs_total', 'Jobs finalizados por resultado', ['resultado']
+        )
+        self.metrica_erros = self.registro.contador(
+            'boletos_erros_total', 'Falhas de jobs por etapa', ['etapa']
+        )
+
+    def encerrar(self, motivo: str = None):
+        """
+        Para de retirar jobs da fila; os em andamento terminam (até o prazo)
+        Segunda chamada (ex.: segundo Ctrl+C) devolve os jobs na hora
+        """
+        if self._parar.is_set():
+            logger.warning("[WORKER] Encerramento forçado: devolvendo jobs em andamento")
+            for tarefa in list(self.tarefas):
+                tarefa.cancel()
+            return
+
+        logger.info(f"[WORKER] Encerrando ({motivo or 'pedido'}): {len(self.tarefas)} job(s) em andamento")
+        self.running = False
+        self._parar.set()
+
+    async def processar_job(self, stream, entry_id, job_bytes, reivindicado: bool = False):
+        """
+        Processa um job e confirma na fila
+
+        Job reivindicado conta como tentativa que falhou: volta pela fila de
+        novas tentativas (ou vai para a DLQ), para que um arquivo que derruba
+        o worker não seja reivindicado para sempre
+        """
+        blob_ref = None
+        job_data = None
+        corpo = b''
+        file_type = None
+        resultado = 'falha'
+        concluido = False
+        devolvido = False
+        decodificado = False
+        cronometro = Cronometro()
+        self.em_andamento.add((stream, entry_id))
         try:
-            analise_id = job_data['analise_id']
-            file_base64 = job_data['file_base64']
-            file_type = job_data['file_type']
-            
+            cronometro.registrar('fila', tempo_na_fila(entry_id))
+            with cronometro.etapa('decodificacao'):
+                job_data, corpo = desempacotar_job(job_bytes)
+                file_bytes = corpo
+                analise_id = job_data['analise_id']
+                file_type = job_data['file_type']
+
+                # Arquivo fora da fila (jobs antigos trazem o arquivo no envelope)
+                blob_ref = job_data.get('blob_ref')
+                decodificado = True
+
+            if reivindicado:
+                cronometro.falha = 'reivindicacao'
+                raise JobAbandonado(
+                    f"Job abandonado por outro worker (pendente há mais de {settings.fila_reclaim_ocioso}s)"
+                )
+
+            if blob_ref:
+                with cronometro.etapa('decodificacao'):
+                    file_bytes = await self.blob_store.obter(blob_ref)
+
             logger.info(f"[WORKER] Processando job: {analise_id}")
-            
+            await self._publicar(job_data, 'processing', tentativa=job_data.get('tentativa', 1))
+
             # Processar boleto
-            processar_boleto(analise_id, file_base64, file_type)
-            
+            saida = await processar_boleto(analise_id, file_bytes, file_type, cronometro)
+            concluido = True
+            resultado = 'concluido'
+            await self._publicar(job_data, 'completed', is_fraudulento=saida['is_fraudulento'])
+
             logger.info(f"[WORKER] ✅ Job concluído: {analise_id}")
-            
+
+        except asyncio.CancelledError:
+            # Encerramento estourou o prazo: o job volta para a fila
+            # (não confirmar: se a devolução falhar, fica pendente e é reivindicado)
+            devolvido = True
+            resultado = await self._devolver(stream, entry_id, job_bytes, job_data, corpo)
+            raise
         except Exception as e:
             logger.error(f"[WORKER] ❌ Erro ao processar job: {str(e)}")
-    
-    def run(self):
+            self.metrica_erros.inc(etapa=cronometro.falha or 'desconhecida')
+            if decodificado:
+                resultado = await self._tratar_falha(job_data, corpo, e)
+            else:
+                # Envelope ilegível: não há análise para marcar nem como tentar de novo
+                resultado = 'invalido'
+
+        finally:
+            self._registrar_metricas(cronometro, file_type, resultado)
+
+            # Confirmar antes de liberar o arquivo: se o worker morrer entre os
+            # dois, sobra só um arquivo órfão (expira pelo TTL), não um job sem arquivo.
+            # Com nova tentativa agendada o arquivo fica para ela; na DLQ, o job
+            # não volta mais e a referência é solta como num job concluído
+            if not devolvido and resultado in RESULTADOS_CONFIRMADOS:
+                await self._confirmar(stream, entry_id)
+            if blob_ref and (concluido or resultado == 'dlq'):
+                await self._liberar_blob(blob_ref)
+            self.em_andamento.discard((stream, entry_id))
+            self.slots.release()
+
+    async def _tratar_falha(self, job_data, corpo, erro) -> str:
+        """
+        Agenda nova tentativa ou envia o job para a DLQ
+
+        Returns:
+            Destino do job ('retry', 'dlq' ou 'falha' se não conseguiu gravar nenhum dos dois)
+        """
+        analise_id = job_data.get('analise_id')
+        tentativa = job_data.get('tentativa', 1)
+        mensagem = str(erro)
+
+        try:
+            if not isinstance(erro, ERROS_DEFINITIVOS) and self.retry.pode_tentar_novamente(job_data):
+                await self.retry.agendar(job_data, corpo, mensagem, self.fila.stream_do_job(job_data))
+                destino = 'retry'
+            else:
+                await self.retry.enviar_dlq(job_data, mensagem)
+                destino = 'dlq'
+        except Exception as e:
+            logger.error(f"[WORKER] Erro ao tratar falha de {analise_id}: {str(e)}")
+            return 'falha'
+
+        # Já gravado no Redis: erro daqui em diante não pode deixar o job pendente
+        # (seria reivindicado e agendado de novo)
+        try:
+            # Análise já concluída por outra execução: status fica como está
+            if destino == 'retry':
+                if await registrar_nova_tentativa(analise_id, mensagem, tentativa):
+                    await self._publicar(job_data, 'processing', tentativa=tentativa + 1, erro=mensagem)
+            elif await registrar_falha(analise_id, mensagem, tentativa):
+                await self._publicar(job_data, 'failed', erro=mensagem)
+        except Exception as e:
+            logger.error(f"[WORKER] Erro ao registrar falha de {analise_id}: {str(e)}")
+        return destino
+
+    async def _publicar(self, job_data, status, **dados):
+        """Avisa a API (pub/sub) da mudança de status da análise"""
+        await publicar_status(
+            self.redis_conn, job_data['analise_id'], status, job_data.get('user_id'), **dados
+        )
+
+    def _registrar_metricas(self, cronometro, file_type, resultado):
+        """Duração das etapas do job e resultado"""
+        for etapa, duracao_ms in cronometro.etapas.items():
+            self.metrica_etapas.observar(
+                duracao_ms / 1000, etapa=etapa, tipo_arquivo=file_type or 'desconhecido'
+            )
+        self.metrica_jobs.inc(resultado=resultado)
+
+    async def coletar_metricas(self) -> str:
+        """Texto das métricas (atualiza fila, cache e jobs em andamento)"""
+        self.metrica_em_andamento.definir(len(self.tarefas))
+        await self.metricas_fila.atualizar(self.fila, self.retry)
+        return self.registro.exportar()
+
+    async def _confirmar(self, stream, entry_id):
+        """Confirma (XACK) o job na fila"""
+        try:
+            await self.fila.confirmar(stream, entry_id)
+        except Exception as e:
+            logger.error(f"[WORKER] Erro ao confirmar job {entry_id}: {str(e)}")
+
+    async def _devolver(self, stream, entry_id, job_bytes, job_data=None, corpo=b''):
+        """
+        Devolve o job inacabado à fila; a interrupção conta como tentativa
+        (job que sempre estoura o prazo não volta à fila para sempre)
+
+        Returns:
+            Destino do job ('devolvido', 'dlq' ou 'falha')
+        """
+        try:
+            if job_data is not None:
+                if not self.retry.pode_tentar_novamente(job_data):
+                    if not await self.fila.pendente(stream, entry_id):
+                        logger.info(f"[WORKER] Job {entry_id} já reivindicado por outro worker")
+                        return 'devolvido'
+                    resultado = await self._tratar_falha(
+                        job_data, corpo, JobInterrompido("Job interrompido no encerramento do worker")
+                    )
+                    if resultado in RESULTADOS_CONFIRMADOS:
+                        await self._confirmar(stream, entry_id)
+                    return resultado
+
+                novo = {**job_data, 'tentativa': job_data.get('tentativa', 1) + 1}
+                job_bytes = empacotar_job(novo, corpo)
+
+            if await self.fila.devolver(stream, entry_id, job_bytes):
+                logger.info(f"[WORKER] ↩️ Job devolvido à fila: {entry_id}")
+            else:
+                logger.info(f"[WORKER] Job {entry_id} já reivindicado por outro worker")
+            return 'devolvido'
+        except Exception as e:
+            logger.error(f"[WORKER] Erro ao devolver job {entry_id}: {str(e)}")
+            return 'falha'
+
+
+    async def _liberar_blob(self, blob_ref):
+        """Remove o arquivo do job (se nenhum outro job o referenciar)"""
+        try:
+            await self.blob_store.liberar(blob_ref)
+        except Exception as e:
+            logger.warning(f"[WORKER] Erro ao liberar arquivo {blob_ref}: {str(e)}")
+
+    async def _buscar_job(self):
+        """
+        Próximo job: primeiro pendentes abandonados (periodicamente), depois novos
+
+        Returns:
+            (stream, entry_id, job_bytes[, reivindicado]) ou None
+        """
+        loop = asyncio.get_running_loop()
+
+        if loop.time() >= self._proximo_retry:
+            await self.retry.mover_vencidos(self.fila.prioridades)
+            self._proximo_retry = loop.time() + 1
+
+        if loop.time() >= self._proximo_reclaim:
+            await self.fila.migrar_fila_legada()
+            jobs = await self.fila.reivindicar(self.consumidor, self.reclaim_ocioso_ms)
+            if jobs:
+                # Pode haver mais: continua reivindicando na próxima vaga
+                return (*jobs[0], True)
+            self._proximo_reclaim = loop.time() + self.reclaim_intervalo
+
+        jobs = await self.fila.ler(self.consumidor)
+        if not jobs and await self._ate_parar(self.fila.aguardar_sinal(5000)):
+            jobs = await self.fila.ler(self.consumidor)
+        return jobs[0] if jobs else None
+
+    async def _ate_parar(self, espera):
+        """
+        Aguarda a corrotina, desistindo (cancelando) se o worker for encerrado
+
+        Returns:
+            Resultado da corrotina, ou None se o worker foi encerrado antes
+        """
+        tarefa = asyncio.ensure_future(espera)
+        parada = asyncio.ensure_future(self._parar.wait())
+        try:
+            await asyncio.wait({tarefa, parada}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            parada.cancel()
+
+        if tarefa.done():
+            return tarefa.result()
+
+        tarefa.cancel()
+        return None
+
+    async def run(self):
         """Loop principal do worker"""
         logger.info(" Worker iniciado!")
-        logger.info(f"Escutando fila: {self.queue_name}")
-        
-        while self.running:
+        faixas = ', '.join(f"{p}={self.fila.pesos[p]}" for p in self.fila.prioridades)
+        logger.info(f"Escutando filas: {faixas} (consumidor {self.consumidor})")
+        logger.info(f"Concorrência: {self.concurrency} jobs ({self.fila.max_por_usuario} por usuário)")
+
+        if isinstance(self.blob_store, FilesystemBlobStore):
+            await asyncio.to_thread(self.blob_store.limpar_orfaos)
+
+        servidor_metricas = await self._iniciar_metricas()
+        renovacao = asyncio.create_task(self._renovar_em_andamento())
+
+        try:
+            while self.running:
+                # Esperar vaga livre antes de consumir a fila (backpressure)
+                if not await self._ate_parar(self.slots.acquire()):
+                    break
+
+                submetido = False
+                try:
+                    # Buscar job da fila (blocking com timeout)
+                    job = await self._buscar_job()
+
+                    if job:
+                        # Processar como tarefa (a vaga é liberada ao final do job)
+                        tarefa = asyncio.create_task(self.processar_job(*job))
+                        self.tarefas.add(tarefa)
+                        tarefa.add_done_callback(self.tarefas.discard)
+                        submetido = True
+
+                except Exception as e:
+                    logger.error(f"[WORKER] Erro: {str(e)}")
+                    await asyncio.sleep(1)
+                finally:
+                    if not submetido:
+                        self.slots.release()
+        finally:
+            if servidor_metricas:
+                servidor_metricas.close()
+            esperar_ocr = await self._drenar()
+            renovacao.cancel()
+            await asyncio.gather(renovacao, return_exceptions=True)
+            await self.redis_conn.aclose()
+            fechar_ocr_pool(esperar=esperar_ocr)
+
+    async def _renovar_em_andamento(self):
+        """Renova periodicamente as entradas dos jobs em andamento (ver FilaJobs.renovar)"""
+        while True:
+            await asyncio.sleep(self.intervalo_renovacao)
+            if not self.em_andamento:
+                continue
             try:
-                # Buscar job da fila (blocking com timeout)
-                result = self.redis_conn.blpop(self.queue_name, timeout=5)
-                
-                if result:
-                    _, job_json = result
-                    job_data = json.loads(job_json)
-                    
-                    # Processar em thread separada
-                    thread = Thread(target=self.processar_job, args=(job_data,))
-                    thread.start()
-                    
-            except KeyboardInterrupt:
-                logger.info("\n Encerrando worker...")
-                self.running = False
-                break
+                await self.fila.renovar(self.consumidor, list(self.em_andamento))
             except Exception as e:
-                logger.error(f"[WORKER] Erro: {str(e)}")
-                time.sleep(1)
+                logger.warning(f"[WORKER] Erro ao renovar jobs em andamento: {str(e)}")
 
+    async def _iniciar_metricas(self):
+        """Servidor das métricas (None se desligado ou se a porta estiver ocupada)"""
+        porta = settings.worker_metricas_porta
+        if not porta:
+            return None
+
+        try:
+            servidor = await servir_metricas(porta, self.coletar_metricas)
+        except OSError as e:
+            logger.warning(f"[WORKER] Métricas desativadas: porta {porta} indisponível ({str(e)})")
+            return None
+
+        logger.info(f"📈 Métricas em http://0.0.0.0:{porta}/metrics")
+        return servidor
+
+    async def _drenar(self) -> bool:
+        """
+        Espera os jobs em andamento até o prazo; os que não terminarem são
+        cancelados e devolvidos à fila
+
+        Returns:
+            True se todos terminaram no prazo
+        """
+        if not self.tarefas:
+            return True
+
+        logger.info(f"[WORKER] Aguardando {len(self.tarefas)} job(s) (prazo {self.prazo_encerramento}s)")
+        _, pendentes = await asyncio.wait(set(self.tarefas), timeout=self.prazo_encerramento)
+
+        for tarefa in pendentes:
+            tarefa.cancel()
+        if pendentes:
+            logger.warning(f"[WORKER] {len(pendentes)} job(s) não terminaram no prazo: devolvendo à fila")
+            await asyncio.gather(*pendentes, return_exceptions=True)
+
+        return not pendentes
+
+
+async def executar():
+    """Conecta o MongoDB e roda o worker no event loop"""
 
-def main():
-    """Inicializa o worker"""
-    
     # Conectar MongoDB
     logger.info("Conectando ao MongoDB...")
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    loop.run_until_complete(connect_mongodb(settings.mongo_uri, settings.mongo_db_name))
+    await connect_mongodb(settings.mongo_uri, settings.mongo_db_name)
     logger.info("✅ MongoDB conectado!")
-    
+
     # Iniciar worker
     worker = SimpleWorker()
-    worker.run()
+
+    # SIGTERM (deploy) e Ctrl+C: parar de consumir e drenar os jobs em andamento
+    loop = asyncio.get_running_loop()
+    for sinal in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sinal, worker.encerrar, sinal.name)
+        except NotImplementedError:
+            # Windows: handler comum, repassado ao event loop
+            signal.signal(sinal, lambda numero, _: loop.call_soon_threadsafe(
+                worker.encerrar, signal.Signals(numero).name
+            ))
+
+    try:
+        await worker.run()
+    finally:
+        await close_mongodb()
+
+
+def main():
+    """Inicializa o worker"""
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    # Etapas de CPU (parser, validação, modelo) rodam nesse pool;
+    # o OCR tem o próprio pool de processos
+    loop.set_default_executor(ThreadPoolExecutor(
+        max_workers=max(1, settings.worker_cpu_threads),
+        thread_name_prefix='boleto-cpu'
+    ))
+
+    try:
+        loop.run_until_complete(executar())
+    except KeyboardInterrupt:
+        logger.info("\n Encerrando worker...")
+    finally:
+        loop.run_until_complete(loop.shutdown_default_executor())
+        loop.close()
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,52 @@
+"""
+Configuração dos testes: módulos importados a partir de src, como na API e no worker
+"""
+
+import asyncio
+import os
+import sys
+
+import pytest
+from redis import Redis
+from redis import asyncio as aioredis
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+# Banco só dos testes: é apagado antes e depois de cada um
+REDIS_URL_TESTES = os.environ.get('REDIS_URL_TESTES', 'redis://localhost:6379/15')
+
+
+@pytest.fixture
+def redis_url():
+    """
+    Redis de verdade e vazio; sem servidor o teste é pulado (o fakeredis não
+    roda XGROUP dentro dos scripts Lua da fila)
+    """
+    conexao = Redis.from_url(REDIS_URL_TESTES)
+    try:
+        conexao.ping()
+    except RedisConnectionError:
+        pytest.skip(f"Redis indisponível em {REDIS_URL_TESTES}")
+
+    conexao.flushdb()
+    yield REDIS_URL_TESTES
+    conexao.flushdb()
+    conexao.close()
+
+
+@pytest.fixture
+def com_redis(redis_url):
+    """Roda cenario(redis_conn) com um cliente redis.asyncio (um event loop por chamada)"""
+
+    def executar(cenario):
+        async def principal():
+            redis_conn = aioredis.from_url(redis_url)
+            try:
+                return await cenario(redis_conn)
+            finally:
+                await redis_conn.aclose()
+
+        return asyncio.run(principal())
+
+    return executar
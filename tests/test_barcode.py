@@ -0,0 +1,89 @@
+"""
+Testes da leitura do código de barras ITF (ml.barcode)
+"""
+
+import numpy as np
+from PIL import Image
+
+from ml.barcode import (
+    PADROES_ITF,
+    decodificar_linha,
+    ler_codigo_barras,
+    linha_digitavel_de_codigo_barras
+)
+from ml.validator import calcular_dv_modulo11, validar_linha_digitavel
+
+# Exemplo público do Banco do Brasil
+CODIGO_BB = '00193373700000001000500940144816060680935031'
+LINHA_BB = '00190.50095 40144.816069 06809.350314 3 37370000000100'
+
+
+def montar_codigo(banco: str = '001', fator: str = '1234', valor: str = '0000012345') -> str:
+    """Código de barras de 44 dígitos com DV geral (módulo 11) válido"""
+    sem_dv = banco + '9' + fator + valor + '0000001234567890123456789'
+    return sem_dv[:4] + calcular_dv_modulo11(sem_dv) + sem_dv[4:]
+
+
+def pixels_itf(codigo: str, estreito: int = 2, largo: int = 5, silencio: int = 40) -> np.ndarray:
+    """Linha de pixels (0 = barra, 255 = espaço) com o código em ITF"""
+    elementos = [estreito] * 4
+    for i in range(0, len(codigo), 2):
+        barras, espacos = PADROES_ITF[int(codigo[i])], PADROES_ITF[int(codigo[i + 1])]
+        for barra, espaco in zip(barras, espacos):
+            elementos += [largo if barra else estreito, largo if espaco else estreito]
+    elementos += [largo, estreito, estreito]
+
+    linha = [255] * silencio
+    for indice, largura in enumerate(elementos):
+        linha += [0 if indice % 2 == 0 else 255] * largura
+    linha += [255] * silencio
+    return np.array(linha, dtype=np.uint8)
+
+
+def imagem_itf(codigo: str, altura: int = 50) -> Image.Image:
+    return Image.fromarray(np.tile(pixels_itf(codigo), (altura, 1)))
+
+
+def test_decodificar_linha():
+    codigo = montar_codigo()
+    assert decodificar_linha(pixels_itf(codigo)) == codigo
+
+
+def test_decodificar_linha_outra_escala():
+    codigo = montar_codigo()
+    assert decodificar_linha(pixels_itf(codigo, estreito=3, largo=7)) == codigo
+
+
+def test_decodificar_linha_dv_invalido():
+    codigo = montar_codigo()
+    errado = codigo[:4] + str((int(codigo[4]) + 1) % 10) + codigo[5:]
+    assert decodificar_linha(pixels_itf(errado)) is None
+
+
+def test_decodificar_linha_sem_contraste():
+    assert decodificar_linha(np.full(500, 128, dtype=np.uint8)) is None
+
+
+def test_ler_codigo_barras_imagem_sintetica():
+    codigo = montar_codigo()
+    imagem = imagem_itf(codigo)
+
+    assert ler_codigo_barras(imagem) == codigo
+    assert ler_codigo_barras(imagem.rotate(180)) == codigo
+    assert ler_codigo_barras(imagem.rotate(90, expand=True)) == codigo
+
+
+def test_ler_codigo_barras_sem_codigo():
+    assert ler_codigo_barras(Image.new('L', (400, 100), 255)) is None
+
+
+def test_ida_e_volta_ate_a_linha_digitavel():
+    codigo = montar_codigo()
+    linha = linha_digitavel_de_codigo_barras(ler_codigo_barras(imagem_itf(codigo)))
+
+    assert validar_linha_digitavel(linha)['valido']
+    assert linha.endswith(f"{codigo[4]} {codigo[5:19]}")
+
+
+def test_linha_digitavel_de_codigo_barras():
+    assert linha_digitavel_de_codigo_barras(CODIGO_BB) == LINHA_BB
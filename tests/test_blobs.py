@@ -0,0 +1,63 @@
+"""
+Testes do armazenamento de arquivos com contagem de referências (jobs.blobs)
+"""
+
+import asyncio
+
+import pytest
+
+from jobs.blobs import BlobNaoEncontrado, FilesystemBlobStore, RedisBlobStore
+
+
+@pytest.fixture(params=['redis', 'filesystem'])
+def criar_store(request, tmp_path):
+    def criar(redis_conn):
+        if request.param == 'filesystem':
+            return FilesystemBlobStore(redis_conn, str(tmp_path / 'blobs'))
+        return RedisBlobStore(redis_conn)
+
+    return criar
+
+
+def test_mesmo_arquivo_enviado_duas_vezes(com_redis, criar_store):
+    async def cenario(redis_conn):
+        store = criar_store(redis_conn)
+
+        primeira = await store.salvar(b'%PDF-1.4 boleto')
+        segunda = await store.salvar(b'%PDF-1.4 boleto')
+        assert primeira == segunda
+
+        # Só o último job a soltar a referência remove o arquivo
+        await store.liberar(primeira)
+        assert await store.obter(segunda) == b'%PDF-1.4 boleto'
+
+        await store.liberar(segunda)
+        with pytest.raises(BlobNaoEncontrado):
+            await store.obter(segunda)
+
+        # Depois de removido, um novo envio começa a contagem do zero
+        await store.salvar(b'%PDF-1.4 boleto')
+        assert await store.obter(primeira) == b'%PDF-1.4 boleto'
+
+    com_redis(cenario)
+
+
+def test_arquivos_diferentes(com_redis, criar_store):
+    async def cenario(redis_conn):
+        store = criar_store(redis_conn)
+
+        um = await store.salvar(b'um')
+        outro = await store.salvar(b'outro')
+        await store.liberar(um)
+
+        assert um != outro
+        assert await store.obter(outro) == b'outro'
+        with pytest.raises(BlobNaoEncontrado):
+            await store.obter(um)
+
+    com_redis(cenario)
+
+
+def test_referencia_invalida():
+    with pytest.raises(ValueError):
+        asyncio.run(RedisBlobStore(None).obter('md5:abc'))
@@ -0,0 +1,43 @@
+"""
+Testes do envelope binário dos jobs (jobs.envelope)
+"""
+
+import base64
+import json
+
+from jobs.envelope import MAGIC, empacotar_job, desempacotar_job
+
+METADADOS = {'analise_id': 'abc123', 'file_type': 'application/pdf', 'tentativa': 2}
+
+
+def test_ida_e_volta():
+    arquivo = bytes(range(256)) + MAGIC
+
+    metadados, corpo = desempacotar_job(empacotar_job(METADADOS, arquivo))
+
+    assert metadados == METADADOS
+    assert corpo == arquivo
+
+
+def test_ida_e_volta_sem_arquivo():
+    # Arquivo no blob store: o envelope leva só a referência
+    metadados = {**METADADOS, 'blob_ref': 'sha256:ff'}
+
+    assert desempacotar_job(empacotar_job(metadados, b'')) == (metadados, b'')
+
+
+def test_envelope_sem_base64():
+    envelope = empacotar_job(METADADOS, b'\xff' * 1000)
+
+    assert envelope.startswith(MAGIC)
+    assert len(envelope) < 1000 + 100
+
+
+def test_job_legado_json():
+    arquivo = b'%PDF-1.4 conteudo'
+    legado = json.dumps({**METADADOS, 'file_base64': base64.b64encode(arquivo).decode()}).encode()
+
+    metadados, corpo = desempacotar_job(legado)
+
+    assert metadados == METADADOS
+    assert corpo == arquivo
@@ -0,0 +1,112 @@
+"""
+Testes da fila de jobs por faixa e usuário (jobs.fila)
+Os scripts Lua precisam de um Redis de verdade (fixture redis_url)
+"""
+
+from collections import Counter
+
+from redis import asyncio as aioredis
+
+from jobs.fila import LISTA_SINAL, FilaJobs, chave_ativos
+
+PESOS = {'premium': 6, 'autenticado': 3, 'anonimo': 1}
+
+
+def job_de(usuario: str, prioridade: str = 'autenticado') -> dict:
+    return {'analise_id': f'analise-{usuario}', 'user_id': usuario, 'prioridade': prioridade}
+
+
+def test_ordem_faixas_respeita_os_pesos():
+    fila = FilaJobs(aioredis.Redis(), pesos=PESOS)
+
+    ordens = [fila._ordem_faixas() for _ in range(20)]
+
+    assert Counter(ordem[0] for ordem in ordens) == {'premium': 12, 'autenticado': 6, 'anonimo': 2}
+    assert all(sorted(ordem) == sorted(PESOS) for ordem in ordens)
+
+
+def test_ordem_faixas_intercala():
+    fila = FilaJobs(aioredis.Redis(), pesos=PESOS)
+
+    escolhidas = [fila._ordem_faixas()[0] for _ in range(10)]
+
+    # Suave: as faixas se intercalam em vez de 6 premium seguidos
+    assert escolhidas == [
+        'premium', 'autenticado', 'premium', 'premium', 'autenticado',
+        'premium', 'anonimo', 'premium', 'autenticado', 'premium'
+    ]
+
+
+def test_ler_confirmar_devolver(com_redis):
+    async def cenario(redis_conn):
+        fila = FilaJobs(redis_conn, pesos=PESOS, max_por_usuario=2)
+        stream = fila.stream_do_job(job_de('ana'))
+        for numero in range(3):
+            await fila.enfileirar(f'job-{numero}'.encode(), job_de('ana'))
+
+        [(_, id_0, job_0)] = await fila.ler('w1')
+        [(_, id_1, job_1)] = await fila.ler('w2')
+        assert (job_0, job_1) == (b'job-0', b'job-1')
+
+        # Limite por usuário conta os pendentes de todos os workers
+        assert await fila.ler('w1') == []
+
+        await fila.confirmar(stream, id_0)
+        assert not await fila.pendente(stream, id_0)
+        [(_, id_2, job_2)] = await fila.ler('w1')
+        assert job_2 == b'job-2'
+
+        # Devolvido vai para o fim da sub-fila com outro ID
+        assert await fila.devolver(stream, id_1, job_1)
+        assert not await fila.pendente(stream, id_1)
+        assert not await fila.devolver(stream, id_1, job_1)
+        [(_, id_novo, job_novo)] = await fila.ler('w1')
+        assert job_novo == b'job-1' and id_novo != id_1
+        assert await fila.pendente(stream, id_novo)
+
+        await fila.confirmar(stream, id_2)
+        await fila.confirmar(stream, id_novo)
+        return stream
+
+    stream = com_redis(cenario)
+
+    async def esvaziado(redis_conn):
+        fila = FilaJobs(redis_conn, pesos=PESOS)
+        assert await fila.ler('w1') == []
+        # Sub-fila vazia é removida e sai da faixa
+        assert not await redis_conn.exists(stream)
+        assert not await redis_conn.sismember(chave_ativos('autenticado'), stream)
+        assert not await fila.pendente(stream, '0-1')
+
+    com_redis(esvaziado)
+
+
+def test_rodizio_entre_usuarios(com_redis):
+    async def cenario(redis_conn):
+        fila = FilaJobs(redis_conn, pesos=PESOS, max_por_usuario=5)
+        for numero in range(3):
+            await fila.enfileirar(f'ana-{numero}'.encode(), job_de('ana'))
+        await fila.enfileirar(b'bia-0', job_de('bia'))
+
+        lidos = [(await fila.ler('w1'))[0][2] for _ in range(4)]
+
+        # Um job por usuário por vez: quem enviou muito não passa na frente
+        assert sorted(lidos[:2]) == [b'ana-0', b'bia-0']
+        assert lidos[2:] == [b'ana-1', b'ana-2']
+
+    com_redis(cenario)
+
+
+def test_faixa_de_maior_peso_primeiro(com_redis):
+    async def cenario(redis_conn):
+        fila = FilaJobs(redis_conn, pesos=PESOS)
+        await fila.enfileirar(b'anonimo', job_de('1.2.3.4', 'anonimo'))
+        await fila.enfileirar(b'premium', job_de('ana', 'premium'))
+
+        assert (await fila.ler('w1'))[0][2] == b'premium'
+        assert (await fila.ler('w1'))[0][2] == b'anonimo'
+        assert await fila.tamanho() == {'premium': 1, 'autenticado': 0, 'anonimo': 1}
+        # Um aviso por job enfileirado
+        assert await redis_conn.llen(LISTA_SINAL) == 2
+
+    com_redis(cenario)
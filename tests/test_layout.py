@@ -0,0 +1,53 @@
+"""
+Testes da localização da linha digitável na página (ml.layout)
+"""
+
+import numpy as np
+from PIL import Image
+
+from ml.layout import caixa_ficha_compensacao, localizar_faixas_linha_digitavel
+
+
+def escrever_linha(matriz: np.ndarray, y: int, caracteres: int, x: int = 40):
+    """Linha de "caracteres" pretos de 10x20 px, um a cada 15 px"""
+    for inicio in range(x, x + caracteres * 15, 15):
+        matriz[y:y + 20, inicio:inicio + 10] = 0
+
+
+def pagina() -> np.ndarray:
+    return np.full((1200, 900), 255, dtype=np.uint8)
+
+
+def test_localiza_a_linha_digitavel():
+    matriz = pagina()
+    for y in (200, 240, 280):
+        escrever_linha(matriz, y, 20)
+    escrever_linha(matriz, 700, 50)
+
+    faixas = localizar_faixas_linha_digitavel(Image.fromarray(matriz))
+
+    # Com margem em volta do texto (o Tesseract erra em recortes justos)
+    assert faixas == [(21, 690, 785, 40)]
+
+
+def test_candidatas_pela_quantidade_de_caracteres():
+    matriz = pagina()
+    escrever_linha(matriz, 300, 38)
+    escrever_linha(matriz, 700, 48)
+    escrever_linha(matriz, 900, 55, x=5)
+
+    faixas = localizar_faixas_linha_digitavel(Image.fromarray(matriz), max_faixas=2)
+
+    assert [y for _, y, _, _ in faixas] == [690, 890]
+
+
+def test_pagina_sem_linha_digitavel():
+    matriz = pagina()
+    escrever_linha(matriz, 300, 20)
+
+    assert localizar_faixas_linha_digitavel(Image.fromarray(matriz)) == []
+    assert localizar_faixas_linha_digitavel(Image.fromarray(pagina())) == []
+
+
+def test_caixa_ficha_compensacao():
+    assert caixa_ficha_compensacao((21, 690, 785, 40), 900, 1200) == (0, 690, 900, 510)
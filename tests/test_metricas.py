@@ -0,0 +1,50 @@
+"""
+Testes do formato texto do Prometheus (jobs.metricas)
+"""
+
+from jobs.metricas import Registro
+
+
+def test_exportar_contador_e_medidor():
+    registro = Registro()
+    erros = registro.contador('boletos_erros_total', 'Erros por etapa', ['etapa'])
+    fila = registro.medidor('boletos_fila_jobs', 'Jobs na fila')
+
+    erros.inc(etapa='ocr')
+    erros.inc(2, etapa='ocr')
+    erros.inc(etapa='parser')
+    fila.definir(7.5)
+
+    assert registro.exportar() == (
+        '# HELP boletos_erros_total Erros por etapa\n'
+        '# TYPE boletos_erros_total counter\n'
+        'boletos_erros_total{etapa="ocr"} 3\n'
+        'boletos_erros_total{etapa="parser"} 1\n'
+        '# HELP boletos_fila_jobs Jobs na fila\n'
+        '# TYPE boletos_fila_jobs gauge\n'
+        'boletos_fila_jobs 7.5\n'
+    )
+
+
+def test_exportar_histograma():
+    registro = Registro()
+    duracao = registro.histograma('boletos_job_segundos', 'Duração', ['tipo'], buckets=(1, 5))
+
+    duracao.observar(0.5, tipo='pdf')
+    duracao.observar(3, tipo='pdf')
+    duracao.observar(10, tipo='pdf')
+
+    assert registro.exportar().splitlines()[2:] == [
+        'boletos_job_segundos_bucket{tipo="pdf",le="1"} 1',
+        'boletos_job_segundos_bucket{tipo="pdf",le="5"} 2',
+        'boletos_job_segundos_bucket{tipo="pdf",le="+Inf"} 3',
+        'boletos_job_segundos_sum{tipo="pdf"} 13.5',
+        'boletos_job_segundos_count{tipo="pdf"} 3'
+    ]
+
+
+def test_rotulos_escapados():
+    registro = Registro()
+    registro.contador('boletos_total', 'Total', ['arquivo']).inc(arquivo='a"b\\c\nd')
+
+    assert 'boletos_total{arquivo="a\\"b\\\\c\\nd"} 1' in registro.exportar()
@@ -0,0 +1,127 @@
+"""
+Testes do pool de processos de OCR (ml.ocr_pool): timeout, cancelamento e vagas
+"""
+
+import asyncio
+import subprocess
+import sys
+import time
+
+import pytest
+
+from ml import ocr_pool
+from ml.ocr_pool import OCRPool, OCRTimeoutError, _Vagas
+
+
+def ocr_falso(imagem_bytes: bytes, idioma: str = 'por', timeout: int = 0, arquivo_pid: str = None) -> dict:
+    """
+    Roda no processo do pool no lugar do OCR: um subprocesso que dorme
+    imagem_bytes segundos faz o papel do tesseract
+    """
+    filho = subprocess.Popen([sys.executable, '-c', f'import time; time.sleep({float(imagem_bytes)})'])
+    if arquivo_pid:
+        with open(arquivo_pid, 'w') as f:
+            f.write(str(filho.pid))
+    filho.wait()
+    return {'texto': imagem_bytes.decode(), 'metodo': 'pagina_inteira'}
+
+
+def processo_vivo(pid: int) -> bool:
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            return f.read().split()[2] != 'Z'
+    except FileNotFoundError:
+        return False
+
+
+def esperar_fim(pid: int, limite: float = 5) -> bool:
+    fim = time.monotonic() + limite
+    while processo_vivo(pid):
+        if time.monotonic() > fim:
+            return False
+        time.sleep(0.05)
+    return True
+
+
+@pytest.fixture
+def pool(monkeypatch, tmp_path):
+    monkeypatch.setattr(ocr_pool, 'MARGEM_TIMEOUT', 0)
+    monkeypatch.setattr(ocr_pool, 'extrair_texto_detalhado', ocr_falso)
+    pool = OCRPool(max_workers=1, timeout=30, opcoes={'arquivo_pid': str(tmp_path / 'pid')})
+    yield pool
+    pool.shutdown(esperar=False)
+
+
+@pytest.mark.skipif(sys.platform != 'linux', reason="lê o estado dos processos em /proc")
+def test_timeout_mata_o_processo_e_os_filhos(pool, tmp_path):
+    async def cenario():
+        # Processo já iniciado: o timeout curto vale só para o job
+        assert await pool.extrair_texto_async(b'0') == '0'
+
+        pool.timeout = 1
+        with pytest.raises(OCRTimeoutError):
+            await pool.extrair_async(b'60')
+        filho = int((tmp_path / 'pid').read_text())
+        assert esperar_fim(filho)
+        assert pool._vagas._livres == 1
+
+        # O pool repõe o processo morto
+        pool.timeout = 30
+        assert await pool.extrair_texto_async(b'0') == '0'
+
+    asyncio.run(cenario())
+
+
+@pytest.mark.skipif(sys.platform != 'linux', reason="lê o estado dos processos em /proc")
+def test_cancelamento_libera_vaga_e_processo(pool, tmp_path):
+    arquivo_pid = tmp_path / 'pid'
+
+    async def cenario():
+        assert await pool.extrair_texto_async(b'0') == '0'
+        arquivo_pid.unlink()
+
+        em_andamento = asyncio.create_task(pool.extrair_async(b'60'))
+        while not arquivo_pid.exists():
+            await asyncio.sleep(0.05)
+        esperando = asyncio.create_task(pool.extrair_async(b'0'))
+        await asyncio.sleep(0.1)
+
+        # Cancelado na espera por vaga: sai da fila sem levar vaga
+        esperando.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await esperando
+        assert pool._vagas._livres == 0 and not pool._vagas._espera
+
+        # Cancelado em andamento (encerramento do worker): processo morto, vaga de volta
+        em_andamento.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await em_andamento
+        assert esperar_fim(int(arquivo_pid.read_text()))
+        assert pool._vagas._livres == 1
+
+        assert await pool.extrair_texto_async(b'0') == '0'
+
+    asyncio.run(cenario())
+
+
+def test_vaga_entregue_a_quem_foi_cancelado_passa_adiante():
+    async def cenario():
+        vagas = _Vagas(1)
+        await vagas.adquirir()
+
+        primeira = asyncio.create_task(vagas.adquirir())
+        segunda = asyncio.create_task(vagas.adquirir())
+        await asyncio.sleep(0)
+
+        # A vaga sai para a primeira da fila, cancelada antes de recebê-la
+        vagas.liberar()
+        primeira.cancel()
+        await asyncio.gather(primeira, return_exceptions=True)
+
+        await asyncio.wait_for(segunda, timeout=1)
+        assert vagas._livres == 0 and not vagas._espera
+
+        vagas.liberar()
+        assert vagas._livres == 1
+
+    asyncio.run(cenario())
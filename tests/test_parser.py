@@ -0,0 +1,63 @@
+"""
+Testes dos campos extraídos da linha digitável (ml.parser)
+"""
+
+from datetime import datetime, timedelta
+
+from ml.parser import (
+    DATA_BASE_FATOR,
+    DATA_BASE_FATOR_NOVA,
+    extrair_valor_linha_digitavel,
+    extrair_vencimento_linha_digitavel,
+    remover_codigos_boleto
+)
+
+LINHA = '00190.50095 40144.816069 06809.350314 3 37370000000100'
+CODIGO = '00193373700000001000500940144816060680935031'
+
+
+def linha_com(fator: int, valor: str = '0000000100') -> str:
+    return f"00190.50095 40144.816069 06809.350314 3 {fator:04d}{valor}"
+
+
+def test_valor_linha_digitavel():
+    assert extrair_valor_linha_digitavel(LINHA) == 1.00
+    assert extrair_valor_linha_digitavel(linha_com(3737, '0000012345')) == 123.45
+
+
+def test_valor_linha_digitavel_sem_valor():
+    assert extrair_valor_linha_digitavel(linha_com(3737, '0000000000')) is None
+
+
+def test_valor_linha_digitavel_incompleta():
+    assert extrair_valor_linha_digitavel(LINHA[:-1]) is None
+
+
+def test_vencimento_ciclo_atual():
+    hoje = datetime.now()
+    fator = 1000 + (hoje - DATA_BASE_FATOR_NOVA).days
+
+    assert extrair_vencimento_linha_digitavel(linha_com(fator)) == hoje.strftime('%d/%m/%Y')
+
+
+def test_vencimento_ciclo_anterior():
+    # 9000: 2022 no primeiro ciclo, 2047 no segundo
+    esperado = DATA_BASE_FATOR + timedelta(days=9000)
+
+    assert extrair_vencimento_linha_digitavel(linha_com(9000)) == esperado.strftime('%d/%m/%Y')
+
+
+def test_vencimento_sem_fator():
+    assert extrair_vencimento_linha_digitavel(linha_com(0)) is None
+    assert extrair_vencimento_linha_digitavel('123') is None
+
+
+def test_remover_codigos_boleto():
+    digitos = LINHA.replace('.', '').replace(' ', '')
+    texto = f"Beneficiário ACME\n{LINHA}\n{digitos}\n{CODIGO}\nCNPJ 12.345.678/0001-95"
+
+    restante = remover_codigos_boleto(texto)
+
+    assert restante.split('\n')[0] == 'Beneficiário ACME'
+    assert 'CNPJ 12.345.678/0001-95' in restante
+    assert '0019' not in restante
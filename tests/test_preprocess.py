@@ -0,0 +1,76 @@
+"""
+Testes do pré-processamento das imagens (ml.preprocess)
+"""
+
+import cv2
+import numpy as np
+import pytest
+
+from ml.preprocess import (
+    LARGURA_PAGINA_POL,
+    calcular_escala,
+    corrigir_inclinacao,
+    estimar_inclinacao,
+    reduzir_para_dpi
+)
+
+
+def pagina_de_texto() -> np.ndarray:
+    """Página branca com linhas de "caracteres" pretos"""
+    matriz = np.full((800, 600), 255, dtype=np.uint8)
+    for y in range(100, 700, 40):
+        for x in range(60, 540, 18):
+            matriz[y:y + 20, x:x + 12] = 0
+    return matriz
+
+
+def girar(matriz: np.ndarray, angulo: float) -> np.ndarray:
+    altura, largura = matriz.shape
+    rotacao = cv2.getRotationMatrix2D((largura / 2, altura / 2), angulo, 1.0)
+    return cv2.warpAffine(matriz, rotacao, (largura, altura), borderMode=cv2.BORDER_CONSTANT, borderValue=255)
+
+
+def test_calcular_escala_reduz_para_o_dpi_alvo():
+    largura = int(600 * LARGURA_PAGINA_POL)
+
+    assert calcular_escala(largura, 300) == pytest.approx(0.5, abs=0.001)
+
+
+def test_calcular_escala_nunca_amplia():
+    assert calcular_escala(800, 300) == 1.0
+    assert calcular_escala(int(300 * LARGURA_PAGINA_POL), 300) == 1.0
+
+
+def test_reduzir_para_dpi():
+    matriz = np.zeros((7000, 4962), dtype=np.uint8)
+
+    reduzida = reduzir_para_dpi(matriz, 300)
+
+    assert reduzida.shape == (3500, 2481)
+    assert reduzir_para_dpi(reduzida, 300) is reduzida
+
+
+@pytest.mark.parametrize('angulo', [3, -5, 10])
+def test_estimar_e_corrigir_inclinacao(angulo):
+    inclinada = girar(pagina_de_texto(), angulo)
+
+    assert estimar_inclinacao(inclinada) == pytest.approx(-angulo, abs=0.5)
+    assert estimar_inclinacao(corrigir_inclinacao(inclinada)) == pytest.approx(0, abs=0.5)
+
+
+def test_pagina_reta_fica_como_esta():
+    matriz = pagina_de_texto()
+
+    assert estimar_inclinacao(matriz) == 0
+    assert corrigir_inclinacao(matriz) is matriz
+
+
+def test_inclinacao_acima_do_maximo_nao_e_corrigida():
+    # Acima de ANGULO_MAXIMO_DESKEW a estimativa não é confiável
+    inclinada = girar(pagina_de_texto(), 30)
+
+    assert corrigir_inclinacao(inclinada) is inclinada
+
+
+def test_pagina_em_branco():
+    assert estimar_inclinacao(np.full((100, 100), 255, dtype=np.uint8)) == 0
@@ -0,0 +1,55 @@
+"""
+Testes do backoff das novas tentativas (jobs.retry)
+"""
+
+import pytest
+
+from jobs import retry
+from jobs.envelope import desempacotar_job
+from jobs.fila import FilaJobs, chave_ativos
+from jobs.retry import AgendadorRetry, calcular_atraso
+
+
+@pytest.mark.parametrize('tentativa, esperado', [(1, 10), (2, 20), (3, 40), (5, 160)])
+def test_atraso_dobra_a_cada_tentativa(monkeypatch, tentativa, esperado):
+    monkeypatch.setattr(retry.random, 'uniform', lambda a, b: b)
+
+    assert calcular_atraso(tentativa, base=10, maximo=300) == esperado
+
+
+def test_atraso_limitado_ao_maximo(monkeypatch):
+    monkeypatch.setattr(retry.random, 'uniform', lambda a, b: b)
+
+    assert calcular_atraso(20, base=10, maximo=300) == 300
+
+
+def test_jitter_metade_do_atraso():
+    for _ in range(200):
+        atraso = calcular_atraso(3, base=10, maximo=300)
+        assert 20 <= atraso <= 40
+
+
+def test_vencido_volta_para_a_fila_do_usuario(com_redis):
+    async def cenario(redis_conn):
+        fila = FilaJobs(redis_conn)
+        job = {'analise_id': 'abc123', 'user_id': 'ana', 'prioridade': 'autenticado', 'tentativa': 1}
+        stream = fila.stream_do_job(job)
+
+        await AgendadorRetry(redis_conn, base=0, maximo=0).agendar(job, b'arquivo', 'falhou', stream)
+        await AgendadorRetry(redis_conn, base=600, maximo=600).agendar(
+            {**job, 'analise_id': 'def456'}, b'', 'falhou', stream
+        )
+
+        agendador = AgendadorRetry(redis_conn)
+        assert await agendador.mover_vencidos(fila.prioridades) == 1
+        assert await agendador.pendentes(fila.prioridades) == 1
+        assert await redis_conn.sismember(chave_ativos('autenticado'), stream)
+
+        [(stream_lido, _, job_bytes)] = await fila.ler('w1')
+        metadados, corpo = desempacotar_job(job_bytes)
+
+        assert stream_lido == stream
+        assert corpo == b'arquivo'
+        assert metadados == {**job, 'tentativa': 2, 'ultimo_erro': 'falhou'}
+
+    com_redis(cenario)